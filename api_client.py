@@ -1,10 +1,16 @@
 from __future__ import annotations
+import asyncio
+import codecs
 import json
-from typing import Any, Dict, List, Optional, Tuple
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import aiohttp
 
 from config import cfg
+from http_client import HttpClient
 
 BASE_URL = "YOUR_BASE_URL"
 APARTMENTS_ENDPOINT = f"{BASE_URL}/END/POINT"
@@ -32,146 +38,491 @@ def _clean_path(p: Optional[str]) -> Optional[str]:
     return s
 
 
-def _photo_candidates_from_obj(obj: Dict[str, Any]) -> List[str]:
-    cands: List[str] = []
+PHOTO_STORAGE_BASES = ("ENDPOINT:PORT", "ENDPOINT", "ENDPOINT")
+PHOTO_FILE_BASE = "ENDPOINT"
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png")
 
-    for key in ("name", "url", "mini"):
-        val = obj.get(key)
-        if not val:
-            continue
-        s = str(val).strip()
 
-        if _is_http(s):
-            cands.append(s)
-            continue
+def photo_key(url: str) -> str:
+    rest = url.split("://", 1)[-1]
+    return rest.split("/", 1)[-1] if "/" in rest else rest
 
-        sp = _clean_path(s)
-        if sp and sp.startswith("storage/"):
-            cands.append(f"ENDPOINT:PORT/{sp}")
-            cands.append(f"ENDPOINT/{sp}")
-            cands.append(f"ENDPOINT/{sp}")
-            continue
 
-        if sp and (sp.lower().endswith(".jpg") or sp.lower().endswith(".jpeg") or sp.lower().endswith(".png")):
-            cands.append(f"ENDPOINT/{sp}")
+class PhotoUrlResolver:
+    # relative storage/ paths are served by one of several bases; remember the
+    # one that answered so a photo costs one request instead of one per base
 
-    seen = set()
-    out: List[str] = []
-    for u in cands:
-        if u and u not in seen:
-            seen.add(u)
-            out.append(u)
-    return out
-
-
-def _extract_photos_candidates(photos_field: Any) -> List[str]:
-    cands: List[str] = []
-
-    def from_list(lst: List[Any]) -> None:
-        for entry in lst:
-            if isinstance(entry, dict):
-                cands.extend(_photo_candidates_from_obj(entry))
-            elif isinstance(entry, str):
-                s = entry.strip()
-                try:
-                    parsed = json.loads(s)
-                    if isinstance(parsed, list):
-                        for obj in parsed:
-                            if isinstance(obj, dict):
-                                cands.extend(_photo_candidates_from_obj(obj))
-                            elif isinstance(obj, str):
-                                if _is_http(obj):
-                                    cands.append(obj)
-                                else:
-                                    sp = _clean_path(obj)
-                                    if sp and sp.startswith("storage/"):
-                                        cands.append(f"ENDPOINT:PORT/{sp}")
-                                        cands.append(f"ENDPOINT/{sp}")
-                                        cands.append(f"ENDPOINT/{sp}")
-                                    elif sp and (sp.lower().endswith(".jpg") or sp.lower().endswith(
-                                            ".jpeg") or sp.lower().endswith(".png")):
-                                        cands.append(f"ENDPOINT/{sp}")
-                except Exception:
-                    if _is_http(s):
-                        cands.append(s)
-                    else:
-                        sp = _clean_path(s)
-                        if sp and sp.startswith("storage/"):
-                            cands.append(f"ENDPOINT:PORT/{sp}")
-                            cands.append(f"ENDPOINT/{sp}")
-                            cands.append(f"ENDPOINT/{sp}")
-                        elif sp and (sp.lower().endswith(".jpg") or sp.lower().endswith(".jpeg") or sp.lower().endswith(
-                                ".png")):
-                            cands.append(f"ENDPOINT/{sp}")
-
-    if not photos_field:
-        return []
-
-    if isinstance(photos_field, list):
-        from_list(photos_field)
-    elif isinstance(photos_field, str):
-        s = photos_field.strip()
+    def __init__(self, bases: Tuple[str, ...], file_base: str, ttl: int = 3600, max_misses: int = 3):
+        self.bases = tuple(dict.fromkeys(b.rstrip("/") for b in bases))
+        self.file_base = file_base.rstrip("/")
+        self.ttl = ttl
+        self._longest_first = sorted(self.bases, key=len, reverse=True)
+        self.max_misses = max(1, max_misses)
+        self._learned: Optional[Tuple[str, float]] = None
+        self._misses = 0
+        self.counts: Dict[str, int] = {"learned": 0, "forgotten": 0}
+
+    def base(self) -> str:
+        if self._learned and time.monotonic() - self._learned[1] < self.ttl:
+            return self._learned[0]
+        return self.bases[0]
+
+    def _split(self, url: str) -> Optional[Tuple[str, str]]:
+        for b in self._longest_first:
+            if url.startswith(b + "/storage/"):
+                return b, url[len(b) + 1:]
+        return None
+
+    def url(self, ref: str) -> str:
+        if _is_http(ref):
+            return ref
+        if ref.startswith("storage/"):
+            return f"{self.base()}/{ref}"
+        return f"{self.file_base}/{ref}"
+
+    def rebase(self, url: str) -> str:
+        hit = self._split(url)
+        return f"{self.base()}/{hit[1]}" if hit else url
+
+    def alternatives(self, url: str) -> List[str]:
+        hit = self._split(url)
+        if not hit:
+            return []
+        return [f"{b}/{hit[1]}" for b in self.bases if b != hit[0]]
+
+    def learn(self, url: str) -> None:
+        hit = self._split(url)
+        if not hit:
+            return
+        if self.base() != hit[0]:
+            self.counts["learned"] += 1
+            print(f"[PHOTOS] storage photos are served by {hit[0]}")
+        self._learned = (hit[0], time.monotonic())
+        self._misses = 0
+
+    def failed(self, url: str, status: int = 0) -> None:
+        # a missing photo (4xx) says little about the base; an unreachable
+        # host (status 0) or a run of misses does
+        hit = self._split(url)
+        if not hit or not self._learned or self._learned[0] != hit[0]:
+            return
+        self._misses += 1
+        if status == 0 or status >= 500 or self._misses >= self.max_misses:
+            self._learned = None
+            self._misses = 0
+            self.counts["forgotten"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"base": self.base(), **self.counts}
+
+
+photo_urls = PhotoUrlResolver(PHOTO_STORAGE_BASES, PHOTO_FILE_BASE, ttl=cfg.photo_base_ttl)
+
+
+def _photo_ref(value: Any) -> Optional[str]:
+    # absolute url, or a path relative to the photo hosts
+    s = _clean_path(value)
+    if not s:
+        return None
+    if _is_http(s) or s.startswith("storage/") or s.lower().endswith(_IMAGE_EXTS):
+        return s
+    return None
+
+
+def _collect_photo_refs(value: Any, out: List[List[str]]) -> None:
+    # photos arrive as objects, urls, paths, or json-encoded lists of those;
+    # one group of refs per photo, best first
+    if isinstance(value, dict):
+        group = [ref for ref in (_photo_ref(value.get(k)) for k in ("name", "url", "mini")) if ref]
+        if group:
+            out.append(group)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_photo_refs(v, out)
+    elif isinstance(value, str):
+        s = value.strip()
+        if s.startswith(("[", "{")):
+            try:
+                parsed = json.loads(s)
+            except ValueError:
+                return
+            _collect_photo_refs(parsed, out)
+        else:
+            ref = _photo_ref(s)
+            if ref:
+                out.append([ref])
+
+
+class Listing:
+    __slots__ = ("id", "title", "address", "price", "rooms", "area", "condition", "description", "photos",
+                 "photo_fallbacks", "headings", "notes")
+
+    def __init__(
+        self,
+        id: Any = None,
+        title: Any = None,
+        address: Optional[str] = None,
+        price: Any = None,
+        rooms: Any = None,
+        area: Any = None,
+        condition: Optional[int] = None,
+        description: Optional[str] = None,
+        photos: Optional[List[str]] = None,
+        photo_fallbacks: Optional[Dict[str, List[str]]] = None,
+        headings: Optional[List[str]] = None,
+        notes: Optional[List[str]] = None,
+    ):
+        self.id = id
+        self.title = title
+        self.address = address
+        self.price = price
+        self.rooms = rooms
+        self.area = area
+        self.condition = condition
+        self.description = description
+        self.photos = photos or []
+        # photo url -> urls of the same photo to try when it can't be fetched
+        self.photo_fallbacks = photo_fallbacks or {}
+        # every title-like and free-text field, for matching condition keywords
+        self.headings = headings or []
+        self.notes = notes or []
+
+    def __repr__(self) -> str:
+        return f"Listing(id={self.id!r}, title={self.title!r})"
+
+
+def _first_of(item: Dict[str, Any], keys: Tuple[str, ...]) -> Any:
+    for k in keys:
+        v = item.get(k)
+        if v:
+            return v
+    return None
+
+
+def _item_address(item: Dict[str, Any]) -> Optional[str]:
+    for k in ("address", "location", "addr"):
+        if isinstance(item.get(k), str) and item[k].strip():
+            return item[k].strip()
+    addr = item.get("address")
+    if isinstance(addr, dict):
+        city = addr.get("city")
+        street = " ".join(x for x in (addr.get("street_type"), addr.get("street")) if x)
+        house = addr.get("house") or addr.get("house_number")
+        parts = [p for p in (city, street, house) if p]
+        if parts:
+            return ", ".join(parts)
+    return None
+
+
+def _item_price(item: Dict[str, Any]) -> Any:
+    if item.get("price"):
+        return item["price"]
+    prices = item.get("prices")
+    if isinstance(prices, dict) and prices.get("value"):
+        p = prices["value"]
         try:
-            parsed = json.loads(s)
-            if isinstance(parsed, list):
-                from_list(parsed)
+            return float(p)
         except Exception:
-            if _is_http(s):
-                cands.append(s)
-    seen = set()
-    out: List[str] = []
-    for u in cands:
-        if u and u not in seen:
-            seen.add(u)
-            out.append(u)
-    return out
-
-
-def _normalize_item(item: Dict[str, Any]) -> Dict[str, Any]:
-    candidates = _extract_photos_candidates(item.get("photos"))
-    for alt_key in ("images", "image_urls", "gallery"):
-        alt = item.get(alt_key)
-        if isinstance(alt, list):
-            for e in alt:
-                if isinstance(e, str) and _is_http(e):
-                    candidates.append(e)
-                elif isinstance(e, dict):
-                    candidates.extend(_photo_candidates_from_obj(e))
-        elif isinstance(alt, str) and _is_http(alt):
-            candidates.append(alt)
+            return str(p)
+    return None
+
+
+def _item_condition(item: Dict[str, Any]) -> Optional[int]:
+    for key in ("condition_in", "condition_id", "condition"):
+        raw = item.get(key)
+        if isinstance(raw, int):
+            return raw
+        if isinstance(raw, str):
+            m = re.search(r"\d+", raw)
+            if m:
+                return int(m.group(0))
+    return None
+
+
+def _item_strings(item: Dict[str, Any], keys: Tuple[str, ...]) -> List[str]:
+    return [item[k].strip() for k in keys if isinstance(item.get(k), str) and item[k].strip()]
+
+
+def _item_description(item: Dict[str, Any]) -> Optional[str]:
+    return "\n".join(_item_strings(item, ("description", "description_short", "body", "text"))) or None
+
+
+def _photo_urls(item: Dict[str, Any]) -> Tuple[List[str], Dict[str, List[str]]]:
+    groups: List[List[str]] = []
+    for key in ("photos", "images", "image_urls", "gallery"):
+        _collect_photo_refs(item.get(key), groups)
 
     seen = set()
     uniq: List[str] = []
-    for u in candidates:
-        if u and u not in seen:
-            seen.add(u)
-            uniq.append(u)
+    fallbacks: Dict[str, List[str]] = {}
+    for group in groups:
+        urls = list(dict.fromkeys(photo_urls.url(ref) for ref in group))
+        key = photo_key(urls[0])
+        if key in seen:
+            continue
+        seen.add(key)
+        uniq.append(urls[0])
+        if len(urls) > 1:
+            fallbacks[urls[0]] = urls[1:]
+    return uniq, fallbacks
+
+
+def _normalize_item(item: Dict[str, Any]) -> Listing:
+    # resolve the alternative key spellings once; the raw dict is dropped after this
+    photos, photo_fallbacks = _photo_urls(item)
+    return Listing(
+        id=item.get("id"),
+        title=_first_of(item, ("title", "name", "headline")),
+        address=_item_address(item),
+        price=_item_price(item),
+        rooms=_first_of(item, ("rooms", "rooms_in", "roomCount")),
+        area=_first_of(item, ("area_total", "area", "square")),
+        condition=_item_condition(item),
+        description=_item_description(item),
+        photos=photos,
+        photo_fallbacks=photo_fallbacks,
+        headings=_item_strings(item, ("title", "name", "headline")),
+        notes=_item_strings(item, ("description", "short_description", "body", "comment", "notes")),
+    )
+
+
+def _canonical_value(v: Any) -> Any:
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, str):
+        return v.strip()
+    if isinstance(v, (list, tuple, set)):
+        vals = {json.dumps(_canonical_value(x), sort_keys=True): _canonical_value(x) for x in v}
+        return [vals[k] for k in sorted(vals)]
+    if isinstance(v, dict):
+        return {str(k): _canonical_value(x) for k, x in v.items()}
+    return v
+
+
+def canonical_filters(filters: Dict[str, Any]) -> str:
+    # empty values never reach the payload, so they don't split the cache either
+    clean = {k: _canonical_value(v) for k, v in (filters or {}).items() if v not in (None, "", [], {})}
+    return json.dumps(clean, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _copy_result(res: Dict[str, Any]) -> Dict[str, Any]:
+    return {"results": list(res.get("results") or []), "total": res.get("total", 0)}
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WS = " \t\r\n"
+_JSON_NUMBER_TAIL = "0123456789.eE+-"
+_ITEM_ARRAYS = ("results", "items")
+
+
+class _JsonStream:
+    # just enough of a pull parser to walk a top-level object: values are
+    # decoded with raw_decode once the buffer holds all of them
+
+    def __init__(self, stream: aiohttp.StreamReader, chunk_size: int):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    async def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = await self._stream.read(self._chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self._text.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    async def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JSON_WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self._fill():
+                return ""
+
+    async def take(self, expected: str) -> str:
+        ch = await self.peek()
+        if not ch or ch not in expected:
+            raise ValueError(f"expected {expected!r}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    async def value(self) -> Any:
+        await self.peek()
+        while True:
+            try:
+                val, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not await self._fill():
+                    raise
+                continue
+            # a number cut by the chunk boundary ("12" of "12.5") decodes fine but
+            # isn't finished; in valid json a complete value is never followed by these
+            if self.eof or (end < len(self.buf) and self.buf[end] not in _JSON_NUMBER_TAIL):
+                self.pos = end
+                return val
+            await self._fill()
+
+
+# first characters of a json value that parses, but not as an object
+_JSON_NON_OBJECT_START = frozenset('["-0123456789tfn')
+
+
+async def _iter_json_members(
+    stream: aiohttp.StreamReader, arrays: Tuple[str, ...] = _ITEM_ARRAYS, chunk_size: int = 64 * 1024
+) -> AsyncIterator[Tuple[str, Any, bool]]:
+    # (key, value, is_element): top-level members, with the arrays named in
+    # `arrays` yielded one element at a time as they come off the wire
+    js = _JsonStream(stream, chunk_size)
+    first = await js.peek()
+    if first and first in _JSON_NON_OBJECT_START:
+        raise TypeError(f"top-level JSON is not an object (starts with {first!r})")
+    await js.take("{")
+    if await js.peek() == "}":
+        return
+    while True:
+        key = await js.value()
+        if not isinstance(key, str):
+            raise ValueError("object key is not a string")
+        await js.take(":")
+        if key in arrays and await js.peek() == "[":
+            js.pos += 1
+            if await js.peek() == "]":
+                js.pos += 1
+            else:
+                while True:
+                    yield key, await js.value(), True
+                    if await js.take(",]") == "]":
+                        break
+        else:
+            yield key, await js.value(), False
+        if await js.take(",}") == "}":
+            return
+
+
+_JSON_HEADERS = {"Accept": "application/json"}
+
+
+class BackendUnavailable(RuntimeError):
+    pass
+
+
+class BackendError(RuntimeError):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive failures; after `cooldown`
+    # seconds one probe request goes through (half-open) and decides
 
-    item["_photo_candidates"] = uniq
-    return item
+    def __init__(self, failures: int = 5, cooldown: float = 30.0):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._streak = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.counts: Dict[str, int] = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def retry_in(self) -> float:
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        if self.state == "open" and self.retry_in() <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            self.counts["probes"] += 1
+            return True
+        if self.state == "closed":
+            return True
+        self.counts["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            print("[API] breaker closed: backend is answering again")
+        self.state = "closed"
+        self._streak = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._streak += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self._streak >= self.failures):
+            if self.state == "closed":
+                self.counts["opened"] += 1
+            print(f"[API] breaker open for {self.cooldown:.0f}s after {self._streak} failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        # a probe that ended without a verdict (cancelled) lets the next one through
+        self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self._streak, **self.counts}
+
+
+class _LatencyWindow:
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: "deque[float]" = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+PAYLOAD_MODES = ("a", "b")
+_MODE_FILTER_KEYS = ("microarea_id", "district_id", "rooms_in", "price_max")
 
 
 class ListingsAPI:
-    def __init__(self) -> None:
-        self._session: Optional[aiohttp.ClientSession] = None
-
-    async def _get_session(self) -> aiohttp.ClientSession:
-        if self._session is None or self._session.closed:
-            timeout = aiohttp.ClientTimeout(total=25)
-            headers = {
-                "User-Agent": "AIRealtorBot/2.0",
-                "Accept": "application/json",
-            }
-            self._session = aiohttp.ClientSession(timeout=timeout, headers=headers)
-        return self._session
+    def __init__(self, http: Optional[HttpClient] = None) -> None:
+        self._own_http = http is None
+        self.http = http or HttpClient.from_cfg()
+        self._learned_modes: Dict[Tuple[str, Tuple[str, ...]], Tuple[str, float]] = {}
+        self.mode_counts: Dict[str, int] = {m: 0 for m in PAYLOAD_MODES}
+        self.mode_failures: Dict[str, int] = {m: 0 for m in PAYLOAD_MODES}
+        self._results: "OrderedDict[Tuple[str, int, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int, int], asyncio.Future] = {}
+        self.cache_counts: Dict[str, int] = {"hit": 0, "stale": 0, "miss": 0, "joined": 0, "fallback": 0}
+        self.breaker = CircuitBreaker(cfg.api_breaker_failures, cfg.api_breaker_cooldown)
+        self.latency = _LatencyWindow()
 
     async def close(self) -> None:
-        if self._session and not self._session.closed:
-            await self._session.close()
+        # a shared client belongs to whoever created it
+        if self._own_http:
+            await self.http.close()
+
+    def _timeout(self) -> aiohttp.ClientTimeout:
+        # a few times the recent p95, so a slow backend fails fast instead of
+        # holding every search for the full API_TIMEOUT
+        total = float(cfg.api_timeout)
+        p95 = self.latency.p95()
+        if p95 is not None:
+            total = min(total, max(float(cfg.api_timeout_min), p95 * cfg.api_timeout_factor))
+        return aiohttp.ClientTimeout(total=total, connect=min(total, cfg.http_connect_timeout))
 
     async def _post(self, url: str, json_body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
-        sess = await self._get_session()
-        async with sess.post(url, json=json_body) as resp:
+        sess = await self.http.session()
+        async with sess.post(url, json=json_body, headers=_JSON_HEADERS, timeout=self._timeout()) as resp:
             status = resp.status
             try:
                 data = await resp.json(content_type=None)
@@ -227,37 +578,255 @@ class ListingsAPI:
 
         return body
 
-    def _unpack(self, data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+    def _unpack(self, data: Dict[str, Any]) -> Tuple[List[Listing], int]:
+        # freshly decoded json is ours, so items are read without copying
         items = data.get("results") or data.get("items") or []
         total = data.get("total") or data.get("count") or len(items) or 0
-        normed = [_normalize_item(dict(it)) for it in items if isinstance(it, dict)]
+        normed = [_normalize_item(it) for it in items if isinstance(it, dict)]
         return normed, int(total)
 
-    async def get_apartments(self, filters: Dict[str, Any], limit: int = 3, offset: int = 0) -> Dict[str, Any]:
-        payload_a = self._payload_mode_a(filters, limit, offset)
+    async def _post_items(self, url: str, json_body: Dict[str, Any]) -> Tuple[int, List[Listing], int, Any]:
+        # (status, normalized items, total, error body)
+        if not self.breaker.allow():
+            raise BackendUnavailable(f"listings backend unavailable, retry in {self.breaker.retry_in():.0f}s")
+        started = time.monotonic()
+        verdict = False
         try:
-            print(f"[API] Trying mode A: *_in + *_id payload={payload_a}")
-            st, data = await self._post(APARTMENTS_ENDPOINT, payload_a)
-            if st == 200:
+            res = await self._read_items(url, json_body)
+            verdict = True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            verdict = True
+            self.breaker.record_failure()
+            # callers handle backend trouble as RuntimeError
+            raise RuntimeError(f"{type(e).__name__}: {e}") from e
+        except RuntimeError:
+            # a 200 whose body can't be read is a backend failure too
+            verdict = True
+            self.breaker.record_failure()
+            raise
+        finally:
+            if not verdict:
+                self.breaker.release()
+
+        if res[0] >= 500:
+            self.breaker.record_failure()
+        else:
+            self.latency.record(time.monotonic() - started)
+            self.breaker.record_success()
+        return res
+
+    async def _read_items(self, url: str, json_body: Dict[str, Any]) -> Tuple[int, List[Listing], int, Any]:
+        sess = await self.http.session()
+        async with sess.post(url, json=json_body, headers=_JSON_HEADERS, timeout=self._timeout()) as resp:
+            if resp.status != 200:
+                try:
+                    data = await resp.json(content_type=None)
+                except Exception:
+                    data = {"raw": await resp.text()}
+                return resp.status, [], 0, data
+
+            if not cfg.api_stream_json:
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError as e:
+                    raise RuntimeError(f"HTTP 200: unreadable response: {e}") from None
+                if not isinstance(data, dict):
+                    raise RuntimeError(f"HTTP 200: response is not an object: {str(data)[:200]}")
                 items, total = self._unpack(data)
-                print(f"[API] A OK: items={len(items)} total={total}")
-                return {"results": items, "total": total}
-            else:
-                print(f"[API] HTTP {st}: {data}")
-                raise RuntimeError("HTTP 400")
-        except Exception as e:
-            print(f"[API] A: *_in + *_id error: {e}")
+                return 200, items, total, None
 
-        payload_b = self._payload_mode_b(filters, limit, offset)
-        print(f"[API] Trying mode B: singular keys payload={payload_b}")
-        st, data = await self._post(APARTMENTS_ENDPOINT, payload_b)
+            found: Dict[str, List[Listing]] = {k: [] for k in _ITEM_ARRAYS}
+            meta: Dict[str, Any] = {}
+            try:
+                async for key, value, is_element in _iter_json_members(resp.content):
+                    if is_element:
+                        if isinstance(value, dict):
+                            found[key].append(_normalize_item(value))
+                    elif key not in found:
+                        meta[key] = value
+            except TypeError as e:
+                raise RuntimeError(f"HTTP 200: {e}") from None
+            except ValueError as e:
+                raise RuntimeError(f"HTTP 200: unreadable response: {e}") from None
+
+        items = found["results"] or found["items"]
+        total = meta.get("total") or meta.get("count") or len(items) or 0
+        return 200, items, int(total), None
+
+    def _mode_key(self, filters: Dict[str, Any]) -> Tuple[str, Tuple[str, ...]]:
+        shape = tuple(sorted(k for k in _MODE_FILTER_KEYS if filters.get(k)))
+        return APARTMENTS_ENDPOINT, shape
+
+    def _mode_order(self, key: Tuple[str, Tuple[str, ...]]) -> List[str]:
+        forced = (cfg.api_mode or "").strip().lower()
+        if forced in PAYLOAD_MODES:
+            return [forced]
+        learned = self._learned_modes.get(key)
+        if learned and time.monotonic() - learned[1] < cfg.api_mode_ttl:
+            return [learned[0]] + [m for m in PAYLOAD_MODES if m != learned[0]]
+        return list(PAYLOAD_MODES)
+
+    def mode_stats(self) -> Dict[str, Any]:
+        return {
+            "used": dict(self.mode_counts),
+            "failed": dict(self.mode_failures),
+            "learned": len(self._learned_modes),
+        }
+
+    async def _get_apartments_mode(self, mode: str, filters: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+        if mode == "a":
+            payload = self._payload_mode_a(filters, limit, offset)
+            print(f"[API] Trying mode A: *_in + *_id payload={payload}")
+        else:
+            payload = self._payload_mode_b(filters, limit, offset)
+            print(f"[API] Trying mode B: singular keys payload={payload}")
+
+        st, items, total, error = await self._post_items(APARTMENTS_ENDPOINT, payload)
         if st != 200:
-            raise RuntimeError(f"HTTP {st}: {data}")
+            raise BackendError(st, f"HTTP {st}: {error}")
 
-        items, total = self._unpack(data)
-        print(f"[API] B: singular keys OK: items={len(items)} total={total}")
-        if items and cfg.debug:
-            sample = items[0].get("_photo_candidates", [])[:3]
+        print(f"[API] {mode.upper()} OK: items={len(items)} total={total}")
+        if mode == "b" and items and cfg.debug:
+            sample = items[0].photos[:3]
             if sample:
                 print(f"[API] B photos sample: {sample}")
         return {"results": items, "total": total}
+
+    async def get_apartments(self, filters: Dict[str, Any], limit: int = 3, offset: int = 0) -> Dict[str, Any]:
+        key = (canonical_filters(filters), limit, offset)
+        hit = self._results.get(key)
+        if hit is not None:
+            age = time.monotonic() - hit[0]
+            if age < cfg.search_cache_ttl:
+                self._results.move_to_end(key)
+                self.cache_counts["hit"] += 1
+                return _copy_result(hit[1])
+            if age < cfg.search_cache_ttl + cfg.search_cache_stale:
+                # serve the stale page now, refresh it for the next caller
+                self.cache_counts["stale"] += 1
+                if key not in self._inflight:
+                    asyncio.ensure_future(self._refresh(key, filters, limit, offset))
+                return _copy_result(hit[1])
+        self.cache_counts["miss"] += 1
+        try:
+            return _copy_result(await self._fetch_shared(key, filters, limit, offset))
+        except (RuntimeError, asyncio.TimeoutError):
+            # with the backend failing or the breaker open, an older page beats an error
+            if hit is not None and time.monotonic() - hit[0] < cfg.api_fallback_age:
+                self.cache_counts["fallback"] += 1
+                return _copy_result(hit[1])
+            raise
+
+    async def get_apartments_many(
+        self,
+        filter_sets: List[Dict[str, Any]],
+        limit: int = 3,
+        offset: int = 0,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        cache: bool = False,
+    ) -> List[Dict[str, Any]]:
+        # one result per filter set, in input order; a failed or timed out
+        # set gets an empty page with "error" instead of failing the batch.
+        # bulk runs skip the search cache unless asked, so they don't evict
+        # the pages interactive users are paging through
+        concurrency = max(1, concurrency or cfg.api_batch_concurrency)
+        timeout = timeout or cfg.api_batch_timeout
+
+        unique: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        keys: List[str] = []
+        for filters in filter_sets:
+            key = canonical_filters(filters or {})
+            unique.setdefault(key, filters or {})
+            keys.append(key)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = iter(unique.items())
+
+        async def worker() -> None:
+            for key, filters in pending:
+                if cache:
+                    fetch = self.get_apartments(filters, limit=limit, offset=offset)
+                else:
+                    fetch = self._fetch_apartments(filters, limit, offset)
+                try:
+                    results[key] = await asyncio.wait_for(fetch, timeout)
+                except asyncio.TimeoutError:
+                    results[key] = {"results": [], "total": 0, "error": f"timeout after {timeout}s"}
+                except Exception as e:
+                    results[key] = {"results": [], "total": 0, "error": str(e)}
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(unique)))))
+        print(f"[API] batch: sets={len(keys)} unique={len(unique)} "
+              f"failed={sum(1 for r in results.values() if 'error' in r)}")
+        # duplicates get their own copy so callers can't alias each other's pages
+        return [dict(results[key], results=list(results[key]["results"])) for key in keys]
+
+    async def _fetch_shared(self, key: Tuple[str, int, int], filters: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+        # identical concurrent searches share one upstream request
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch_and_store(key, filters, limit, offset))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.cache_counts["joined"] += 1
+        return await asyncio.shield(fut)
+
+    async def _fetch_and_store(self, key: Tuple[str, int, int], filters: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+        res = await self._fetch_apartments(filters, limit, offset)
+        self._results[key] = (time.monotonic(), res)
+        self._results.move_to_end(key)
+        while len(self._results) > max(1, cfg.search_cache_size):
+            self._results.popitem(last=False)
+        return res
+
+    async def _refresh(self, key: Tuple[str, int, int], filters: Dict[str, Any], limit: int, offset: int) -> None:
+        try:
+            await self._fetch_shared(key, filters, limit, offset)
+        except Exception as e:
+            print(f"[API] background refresh failed: {e}")
+
+    def breaker_stats(self) -> Dict[str, Any]:
+        p95 = self.latency.p95()
+        return {
+            **self.breaker.stats(),
+            "p95": round(p95, 3) if p95 is not None else None,
+            "timeout": self._timeout().total,
+        }
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._results), "inflight": len(self._inflight), **self.cache_counts}
+
+    async def _fetch_apartments(self, filters: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+        # remember which payload mode the backend accepted for this filter shape,
+        # so the common case costs one request instead of a failed A plus B
+        key = self._mode_key(filters)
+        last_error: Optional[Exception] = None
+        for mode in self._mode_order(key):
+            try:
+                res = await self._get_apartments_mode(mode, filters, limit, offset)
+            except BackendUnavailable:
+                raise
+            except Exception as e:
+                if isinstance(e.__cause__, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+                    # a slow or unreachable backend says nothing about the payload
+                    # mode; retrying in the other one would only double the wait
+                    raise
+                if isinstance(e, BackendError) and e.status >= 500:
+                    # neither is a server error; only a 4xx rejects the payload
+                    raise
+                print(f"[API] {mode.upper()} error: {e}")
+                self.mode_failures[mode] += 1
+                learned = self._learned_modes.get(key)
+                if learned and learned[0] == mode:
+                    self._learned_modes.pop(key, None)
+                last_error = e
+                continue
+            self.mode_counts[mode] += 1
+            # stamped only when learned or re-probed, so the TTL still runs out
+            learned = self._learned_modes.get(key)
+            if not learned or learned[0] != mode or time.monotonic() - learned[1] >= cfg.api_mode_ttl:
+                self._learned_modes[key] = (mode, time.monotonic())
+            return res
+        raise last_error
@@ -0,0 +1,95 @@
+import time
+from typing import Callable, List
+
+from parsers import (
+    ParsedText,
+    parse_cache_info,
+    parse_free_text,
+    _parse_rooms,
+    _parse_budget_value,
+    _parse_condition,
+    _detect_location,
+)
+
+ROUNDS = 200
+
+UTTERANCES = [
+    "2к",
+    "до 60к",
+    "центр",
+    "Олена",
+    "квартира",
+    "двушка в центре до 80к",
+    "1 кімнатна на Таїрова",
+    "трешка Аркадія 120000$",
+    "хочу квартиру на фонтане з ремонтом",
+    "будинок в Київському районі",
+    "3 комнаты, Черемушки, без ремонта, до 70 тыс",
+    "однокімнатна квартира, Молдаванка, до 45000",
+    "квартира у Приморському районі після будівельників",
+    "Шевченко 2 кімнати 90k",
+    "дом на Фонтане",
+    "двухкомнатная на Таирова под ремонт",
+    "Французский бульвар евроремонт до 150 000 $",
+    "4к Суворовский",
+    "Котовского, 2к, 50к",
+    "Люстдорфская дорога 2 комн 65 тыс",
+    "шукаю на Слободці, бюджет 55 000",
+    "аркадия 1к с ремонтом",
+    "Пересыпь до 40 тис",
+    "хочу дешевше",
+    "в новостройке от застройщика",
+    "під оздоблення",
+    "капітальний ремонт, 3 кімнати",
+    "Дача Ковалевского 2к",
+    "Академика Королева 2к 75000",
+    "Генерала Петрова 21/1",
+    "до 100000 грн",
+    "$50 000",
+]
+
+
+def _per_extractor(text: str) -> None:
+    _parse_rooms(text)
+    _parse_budget_value(text)
+    _parse_condition(text)
+    _detect_location(text)
+
+
+def _shared(text: str) -> None:
+    pt = ParsedText(text)
+    _parse_rooms(pt)
+    _parse_budget_value(pt)
+    _parse_condition(pt)
+    _detect_location(pt)
+
+
+def _slots(text: str) -> None:
+    pt = ParsedText(text)
+    _parse_rooms(pt)
+    _parse_budget_value(pt)
+    _parse_condition(pt)
+
+
+def _bench(name: str, fn: Callable[[str], None], corpus: List[str]) -> float:
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        for text in corpus:
+            fn(text)
+    per_msg = (time.perf_counter() - t0) / (ROUNDS * len(corpus)) * 1e6
+    print(f"{name:<28} {per_msg:8.1f} us/message")
+    return per_msg
+
+
+def main() -> None:
+    print(f"Corpus: {len(UTTERANCES)} messages x {ROUNDS} rounds")
+    base = _bench("normalize per extractor", _per_extractor, UTTERANCES)
+    shared = _bench("shared ParsedText", _shared, UTTERANCES)
+    _bench("rooms/budget/condition", _slots, UTTERANCES)
+    _bench("parse_free_text", parse_free_text, UTTERANCES)
+    print(f"Saving: {base - shared:.1f} us/message ({(1 - shared / base) * 100:.0f}%)")
+    print(f"parse_free_text cache: {parse_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
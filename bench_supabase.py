@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+HOST = "127.0.0.1"
+PORT = 54329
+LATENCY = 0.02
+CHATS = [1, 10, 50]
+TURNS = 5
+
+os.environ["SUPABASE_URL"] = f"http://{HOST}:{PORT}"
+os.environ["SUPABASE_ANON_KEY"] = "bench.bench.bench"
+
+from supabase_client import SupabaseClient, create_client  # noqa: E402
+
+
+# just enough of PostgREST for the calls SupabaseClient makes: eq filters,
+# limit, insert / upsert / update returning the rows
+class FakePostgrest:
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {"users": [], "sessions": [], "messages": []}
+        self.requests = 0
+
+    def _match(self, req: web.Request) -> List[Dict[str, Any]]:
+        rows = self.tables.setdefault(req.match_info["table"], [])
+        for col, cond in req.query.items():
+            if cond.startswith("eq."):
+                rows = [r for r in rows if str(r.get(col)) == cond[3:]]
+        return rows
+
+    async def handle(self, req: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        table = self.tables.setdefault(req.match_info["table"], [])
+
+        if req.method == "GET":
+            rows = self._match(req)
+            if "limit" in req.query:
+                rows = rows[:int(req.query["limit"])]
+            return web.json_response(rows)
+
+        if req.method == "PATCH":
+            patch = await req.json()
+            rows = self._match(req)
+            for r in rows:
+                r.update(patch)
+            return web.json_response(rows)
+
+        body = await req.json()
+        out = []
+        for row in body if isinstance(body, list) else [body]:
+            key = req.query.get("on_conflict")
+            existing = next((r for r in table if key and r.get(key) == row.get(key)), None)
+            if existing is not None:
+                existing.update(row)
+                out.append(existing)
+            else:
+                row = {"id": str(uuid.uuid4()), **row}
+                table.append(row)
+                out.append(row)
+        return web.json_response(out, status=201)
+
+
+def _serve(fake: FakePostgrest, ready: threading.Event) -> None:
+    # own thread and loop, so a blocked bot loop can't slow the server down
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_route("*", "/rest/v1/{table}", fake.handle)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, HOST, PORT).start())
+    ready.set()
+    loop.run_forever()
+
+
+async def _chat(supa: SupabaseClient, tg_id: int) -> None:
+    # the Supabase part of one on_text turn
+    user = SimpleNamespace(id=tg_id, username=f"u{tg_id}", first_name="Bench")
+    await supa.get_or_create_user(user)
+    for _ in range(TURNS):
+        session = await supa.get_or_create_session(tg_id)
+        u = await supa.get_or_create_user_obj(tg_id)
+        await supa.append_message(session["id"], u["id"], "in", "двушка в центре до 80к")
+        await supa.patch_session(session["id"], {"last_query": {"answers": {"rooms_in": [2]}}})
+        await supa.append_message(session["id"], u["id"], "out", "...")
+
+
+async def _lag_probe(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - t0 - 0.005)
+
+
+async def _bench(name: str, workers: int, chats: int, base_id: int) -> None:
+    supa = SupabaseClient(workers=workers)
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.ensure_future(_lag_probe(stop, lags))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_chat(supa, base_id + i) for i in range(chats)))
+    elapsed = time.perf_counter() - t0
+
+    stop.set()
+    await probe
+    await supa.close()
+    turns = chats * TURNS
+    print(f"{name:<10} chats={chats:<4} {turns / elapsed:8.1f} turns/s  "
+          f"max loop stall {max(lags or [0]) * 1000:7.1f} ms  calls={supa.counts['calls']}")
+
+
+async def main() -> None:
+    print(f"Stand-in PostgREST at {HOST}:{PORT}, {LATENCY * 1000:.0f} ms per request, {TURNS} turns per chat")
+    base_id = 1
+    for chats in CHATS:
+        await _bench("inline", 0, chats, base_id)
+        base_id += chats
+        await _bench("pooled", int(os.getenv("SUPABASE_WORKERS") or 8), chats, base_id)
+        base_id += chats
+
+
+if __name__ == "__main__":
+    if create_client is None:
+        sys.exit("supabase-py is not installed; pip install supabase to run this benchmark")
+    fake = FakePostgrest(LATENCY)
+    ready = threading.Event()
+    threading.Thread(target=_serve, args=(fake, ready), daemon=True).start()
+    ready.wait()
+    asyncio.run(main())
+    print(f"Server handled {fake.requests} requests: {json.dumps({k: len(v) for k, v in fake.tables.items()})}")
@@ -46,30 +46,130 @@ class Cfg:
     bot_token: str
     supabase_url: str
     supabase_anon_key: str
+    supabase_workers: int
+    supabase_max_pending: int
+    message_batch_size: int
+    message_flush_interval: int
+    message_queue_size: int
+    message_flush_retries: int
+    message_drain_timeout: int
+    session_cache_ttl: int
+    session_cache_size: int
+    user_cache_size: int
+    fallback_max_users: int
+    fallback_max_sessions: int
+    fallback_messages_per_session: int
+    fallback_ttl: int
+    fallback_sqlite_path: str
     api_base: str
     api_key: str
     api_timeout: int
     api_endpoint: str
     api_mode: str
+    api_mode_ttl: int
+    api_stream_json: bool
+    api_timeout_min: int
+    api_timeout_factor: int
+    api_breaker_failures: int
+    api_breaker_cooldown: int
+    api_fallback_age: int
+    api_batch_concurrency: int
+    api_batch_timeout: int
+    search_cache_ttl: int
+    search_cache_stale: int
+    search_cache_size: int
+    prefetch_ttl: int
+    prefetch_max: int
+    http_pool_size: int
+    http_pool_per_host: int
+    http_keepalive: int
+    http_dns_ttl: int
+    http_timeout: int
+    http_connect_timeout: int
+    page_window: int
+    page_max_windows: int
+    page_cursor_ttl: int
+    page_cursor_size: int
     sheets_id: str
     gs_service_account_json_path: str
     limit_per_page: int
     texts_ttl_seconds: int
+    photo_host_concurrency: int
+    photo_base_ttl: int
+    file_id_cache_path: str
+    file_id_cache_size: int
+    image_cache_dir: str
+    image_cache_max_mb: int
+    image_cache_fresh_seconds: int
+    image_shrink: bool
+    image_max_side: int
+    image_jpeg_quality: int
+    image_workers: int
     debug: bool
 
 cfg = Cfg(
     bot_token=_get("BOT_TOKEN", "TELEGRAM_BOT_TOKEN"),
     supabase_url=_get("SUPABASE_URL"),
     supabase_anon_key=_get("SUPABASE_ANON_KEY"),
+    supabase_workers=_int("SUPABASE_WORKERS", default=8),
+    supabase_max_pending=_int("SUPABASE_MAX_PENDING", default=64),
+    message_batch_size=_int("MESSAGE_BATCH_SIZE", default=50),
+    message_flush_interval=_int("MESSAGE_FLUSH_INTERVAL", default=2),
+    message_queue_size=_int("MESSAGE_QUEUE_SIZE", default=5000),
+    message_flush_retries=_int("MESSAGE_FLUSH_RETRIES", default=3),
+    message_drain_timeout=_int("MESSAGE_DRAIN_TIMEOUT", default=10),
+    session_cache_ttl=_int("SESSION_CACHE_TTL", default=300),
+    session_cache_size=_int("SESSION_CACHE_SIZE", default=10000),
+    user_cache_size=_int("USER_CACHE_SIZE", default=50000),
+    fallback_max_users=_int("FALLBACK_MAX_USERS", default=10000),
+    fallback_max_sessions=_int("FALLBACK_MAX_SESSIONS", default=10000),
+    fallback_messages_per_session=_int("FALLBACK_MESSAGES_PER_SESSION", default=50),
+    fallback_ttl=_int("FALLBACK_TTL", default=86400),
+    fallback_sqlite_path=_get("FALLBACK_SQLITE_PATH"),
     api_base=_get("LISTINGS_API_BASE", "API_BASE", default="ENDPOINT:PORT").rstrip("/"),
     api_key=_get("LISTINGS_API_KEY", "API_KEY"),
     api_timeout=_int("API_TIMEOUT", default=20),
     api_endpoint=_get("LISTINGS_API_ENDPOINT", default="/api/get_apartments"),
     api_mode=_get("LISTINGS_API_MODE", default="adaptive"),
+    api_mode_ttl=_int("LISTINGS_API_MODE_TTL", default=3600),
+    api_stream_json=_bool("LISTINGS_API_STREAM", default=True),
+    api_timeout_min=_int("API_TIMEOUT_MIN", default=3),
+    api_timeout_factor=_int("API_TIMEOUT_P95_FACTOR", default=3),
+    api_breaker_failures=_int("LISTINGS_API_BREAKER_FAILURES", default=5),
+    api_breaker_cooldown=_int("LISTINGS_API_BREAKER_COOLDOWN", default=30),
+    api_fallback_age=_int("LISTINGS_API_FALLBACK_AGE", default=3600),
+    api_batch_concurrency=_int("LISTINGS_API_BATCH_CONCURRENCY", default=8),
+    api_batch_timeout=_int("LISTINGS_API_BATCH_TIMEOUT", default=30),
+    search_cache_ttl=_int("SEARCH_CACHE_TTL", default=120),
+    search_cache_stale=_int("SEARCH_CACHE_STALE", default=600),
+    search_cache_size=_int("SEARCH_CACHE_SIZE", default=2000),
+    prefetch_ttl=_int("PREFETCH_TTL", default=300),
+    prefetch_max=_int("PREFETCH_MAX", default=1000),
+    http_pool_size=_int("HTTP_POOL_SIZE", default=100),
+    http_pool_per_host=_int("HTTP_POOL_PER_HOST", default=20),
+    http_keepalive=_int("HTTP_KEEPALIVE", default=30),
+    http_dns_ttl=_int("HTTP_DNS_TTL", default=300),
+    http_timeout=_int("HTTP_TIMEOUT", default=25),
+    http_connect_timeout=_int("HTTP_CONNECT_TIMEOUT", default=10),
+    page_window=_int("PAGE_WINDOW", default=12),
+    page_max_windows=_int("PAGE_MAX_WINDOWS", default=2),
+    page_cursor_ttl=_int("PAGE_CURSOR_TTL", default=3600),
+    page_cursor_size=_int("PAGE_CURSOR_SIZE", default=10000),
     sheets_id=_get("GS_SPREADSHEET_ID", "SHEETS_ID"),
     gs_service_account_json_path=_get("GS_SERVICE_ACCOUNT_JSON_PATH", default="credentials/service_account.json"),
     limit_per_page=_int("LIMIT_PER_PAGE", default=3),
     texts_ttl_seconds=_int("TEXTS_TTL_SECONDS", default=900),
+    photo_host_concurrency=_int("PHOTO_HOST_CONCURRENCY", default=8),
+    photo_base_ttl=_int("PHOTO_BASE_TTL", default=3600),
+    file_id_cache_path=_get("FILE_ID_CACHE_PATH", default="cache/file_ids.json"),
+    file_id_cache_size=_int("FILE_ID_CACHE_SIZE", default=20000),
+    image_cache_dir=_get("IMAGE_CACHE_DIR", default="cache/images"),
+    image_cache_max_mb=_int("IMAGE_CACHE_MAX_MB", default=512),
+    image_cache_fresh_seconds=_int("IMAGE_CACHE_FRESH_SECONDS", default=86400),
+    image_shrink=_bool("IMAGE_SHRINK", default=True),
+    image_max_side=_int("IMAGE_MAX_SIDE", default=1280),
+    image_jpeg_quality=_int("IMAGE_JPEG_QUALITY", default=82),
+    image_workers=_int("IMAGE_WORKERS", default=2),
     debug=_bool("DEBUG", default=False),
 )
 
@@ -52,9 +52,7 @@ async def main():
     api = ListingsAPI()
     await test_sections(api)
 
-    sess = getattr(api, "_session", None)
-    if sess and not sess.closed:
-        await sess.close()
+    await api.close()
 
 
 if __name__ == "__main__":
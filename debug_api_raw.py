@@ -2,22 +2,18 @@ import asyncio
 import json
 from typing import Any, Dict, List
 
-import aiohttp
-
 from config import cfg
+from http_client import HttpClient
 
 BASE_URL = "ENDPOINT:PORT"
 APARTMENTS_ENDPOINT = f"{BASE_URL}/way/endpoint"
 
 
 async def fetch_raw_api(payload: Dict[str, Any]) -> Dict[str, Any]:
-    timeout = aiohttp.ClientTimeout(total=25)
-    headers = {
-        "User-Agent": "AIRealtorBotDebug/2.0",
-        "Accept": "application/json",
-    }
-    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-        async with session.post(APARTMENTS_ENDPOINT, json=payload) as resp:
+    http = HttpClient.from_cfg(user_agent="AIRealtorBotDebug/2.0")
+    try:
+        session = await http.session()
+        async with session.post(APARTMENTS_ENDPOINT, json=payload, headers={"Accept": "application/json"}) as resp:
             status = resp.status
             print(f"[DEBUG] HTTP status: {status}")
             try:
@@ -29,6 +25,8 @@ async def fetch_raw_api(payload: Dict[str, Any]) -> Dict[str, Any]:
                 return {}
             print("[DEBUG] Top-level keys:", list(data.keys()))
             return data
+    finally:
+        await http.close()
 
 
 def _pick_items(data: Dict[str, Any]) -> List[Dict[str, Any]]:
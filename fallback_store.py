@@ -0,0 +1,278 @@
+from __future__ import annotations
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 500
+
+
+class _LruTtl:
+
+    def __init__(self, max_entries: int, ttl: float, on_evict: Optional[Callable[[Any, Any], None]] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> [last access (monotonic), value, last persisted (wall clock)]
+        self._items: "OrderedDict[Any, list]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _entry(self, key: Any) -> Optional[list]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            self.pop(key)
+            return None
+        entry[0] = time.monotonic()
+        self._items.move_to_end(key)
+        return entry
+
+    def get(self, key: Any) -> Any:
+        entry = self._entry(key)
+        return entry[1] if entry is not None else None
+
+    def touch_due(self, key: Any, interval: float) -> bool:
+        # true at most once per interval for a live key
+        entry = self._items.get(key)
+        if entry is None or time.time() - entry[2] < interval:
+            return False
+        entry[2] = time.time()
+        return True
+
+    def put(self, key: Any, value: Any) -> None:
+        self._items[key] = [time.monotonic(), value, time.time()]
+        self._items.move_to_end(key)
+        now = time.monotonic()
+        # least recently used first, so expired entries sit at the front
+        while self._items:
+            oldest, (ts, _, _) = next(iter(self._items.items()))
+            if len(self._items) <= self.max_entries and now - ts <= self.ttl:
+                break
+            self.pop(oldest)
+            self.evicted += 1
+
+    def pop(self, key: Any) -> Any:
+        entry = self._items.pop(key, None)
+        if entry is None:
+            return None
+        if self.on_evict is not None:
+            self.on_evict(key, entry[1])
+        return entry[1]
+
+
+class FallbackStore:
+    # what SupabaseClient keeps when the database is off or failing: bounded,
+    # expiring, and optionally mirrored to a local sqlite file. sqlite work
+    # runs on one background thread, writes in batches
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        max_sessions: int = 10000,
+        messages_per_session: int = 50,
+        ttl: float = 86400,
+        sqlite_path: str = "",
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.messages_per_session = max(1, messages_per_session)
+        self.flush_interval = flush_interval
+        self._users = _LruTtl(max_users, ttl)
+        self._sessions = _LruTtl(max_sessions, ttl, on_evict=self._forget_session_id)
+        self._session_ids: Dict[Any, int] = {}
+        self._messages = _LruTtl(max_sessions, ttl)
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[str, tuple]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        if sqlite_path:
+            self._open(sqlite_path)
+
+    def _open(self, path: str) -> None:
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # opened here, then only ever used from the single pool thread
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS users (tg_id INTEGER PRIMARY KEY, row TEXT, ts REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions (tg_id INTEGER PRIMARY KEY, id TEXT, row TEXT, ts REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_id ON sessions (id)")
+            db.execute("CREATE TABLE IF NOT EXISTS messages (session_id TEXT, row TEXT, ts REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id)")
+            # ts is the last access, so only rows nobody touched for a ttl go
+            cutoff = time.time() - self.ttl
+            for table in ("users", "sessions", "messages"):
+                db.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+            db.commit()
+            self._db = db
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fallback-sqlite")
+        except Exception as e:
+            print(f"[fallback_store] sqlite disabled: {e}")
+            self._db = None
+
+    def _queue(self, op: str, *args: Any) -> None:
+        if self._db is None:
+            return
+        self._pending.append((op, args))
+        if len(self._pending) >= FLUSH_BATCH:
+            self._flush()
+            return
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._flush()
+                return
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending or self._pool is None:
+            return
+        batch, self._pending = self._pending, []
+        # the pool has one thread, so batches and reads run in submit order
+        self._pool.submit(self._apply, batch)
+
+    def _apply(self, batch: List[Tuple[str, tuple]]) -> None:
+        trim: Set[str] = set()
+        try:
+            for op, args in batch:
+                if op == "user":
+                    self._db.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", args)
+                elif op == "session":
+                    self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", args)
+                elif op == "message":
+                    self._db.execute("INSERT INTO messages VALUES (?, ?, ?)", args)
+                    trim.add(args[0])
+                elif op == "touch_user":
+                    self._db.execute("UPDATE users SET ts = ? WHERE tg_id = ?", args)
+                elif op == "touch_session":
+                    self._db.execute("UPDATE sessions SET ts = ? WHERE tg_id = ?", args)
+                    self._db.execute("UPDATE messages SET ts = ? WHERE session_id = "
+                                     "(SELECT id FROM sessions WHERE tg_id = ?)", args)
+            for sid in trim:
+                self._db.execute("DELETE FROM messages WHERE session_id = ? AND rowid NOT IN "
+                                 "(SELECT rowid FROM messages WHERE session_id = ? ORDER BY rowid DESC LIMIT ?)",
+                                 (sid, sid, self.messages_per_session))
+            self._db.commit()
+        except Exception as e:
+            print(f"[fallback_store] sqlite write failed, {len(batch)} changes lost: {e}")
+            try:
+                self._db.rollback()
+            except Exception:
+                pass
+
+    def _select(self, sql: str, args: tuple) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._db.execute(sql, args).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"[fallback_store] sqlite read failed: {e}")
+            return None
+
+    async def _read(self, sql: str, *args: Any) -> Optional[Dict[str, Any]]:
+        if self._db is None or self._pool is None:
+            return None
+        self._flush()
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._select, sql, args)
+
+    def _forget_session_id(self, tg_id: Any, session: Dict[str, Any]) -> None:
+        if self._session_ids.get(session.get("id")) == tg_id:
+            self._session_ids.pop(session.get("id"), None)
+
+    def _touch_interval(self) -> float:
+        return self.ttl / 10
+
+    async def get_user(self, tg_id: int) -> Optional[Dict[str, Any]]:
+        user = self._users.get(tg_id)
+        if user is not None:
+            if self._users.touch_due(tg_id, self._touch_interval()):
+                self._queue("touch_user", time.time(), tg_id)
+            return user
+        user = await self._read("SELECT row FROM users WHERE tg_id = ?", tg_id)
+        if user is not None:
+            self._users.put(tg_id, user)
+            self._queue("touch_user", time.time(), tg_id)
+        return user
+
+    def put_user(self, tg_id: int, user: Dict[str, Any]) -> None:
+        self._users.put(tg_id, user)
+        self._queue("user", tg_id, json.dumps(user, default=str), time.time())
+
+    async def get_session(self, tg_id: Any) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(tg_id)
+        if session is not None:
+            if self._sessions.touch_due(tg_id, self._touch_interval()):
+                self._queue("touch_session", time.time(), tg_id)
+            return session
+        session = await self._read("SELECT row FROM sessions WHERE tg_id = ?", tg_id)
+        if session is not None:
+            self._cache_session(tg_id, session)
+            self._queue("touch_session", time.time(), tg_id)
+        return session
+
+    async def session_by_id(self, session_id: Any) -> Optional[Dict[str, Any]]:
+        tg_id = self._session_ids.get(session_id)
+        if tg_id is not None:
+            session = await self.get_session(tg_id)
+            if session is not None:
+                return session
+        session = await self._read("SELECT row FROM sessions WHERE id = ?", str(session_id))
+        if session is not None:
+            self._cache_session(session.get("telegram_user_id"), session)
+            self._queue("touch_session", time.time(), session.get("telegram_user_id"))
+        return session
+
+    def _cache_session(self, tg_id: Any, session: Dict[str, Any]) -> None:
+        self._sessions.put(tg_id, session)
+        self._session_ids[session.get("id")] = tg_id
+
+    def put_session(self, session: Dict[str, Any]) -> None:
+        tg_id = session.get("telegram_user_id")
+        self._cache_session(tg_id, session)
+        self._queue("session", tg_id, str(session.get("id")), json.dumps(session, default=str), time.time())
+
+    def add_message(self, session_id: Any, message: Dict[str, Any]) -> None:
+        sid = str(session_id)
+        ring = self._messages.get(sid)
+        if ring is None:
+            ring = deque(maxlen=self.messages_per_session)
+        ring.append(message)
+        self._messages.put(sid, ring)
+        self._queue("message", sid, json.dumps(message, default=str), time.time())
+
+    def messages(self, session_id: Any) -> List[Dict[str, Any]]:
+        ring = self._messages.get(str(session_id))
+        return list(ring) if ring is not None else []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._users),
+            "sessions": len(self._sessions),
+            "message_sessions": len(self._messages),
+            "evicted": self._users.evicted + self._sessions.evicted + self._messages.evicted,
+            "sqlite": self._db is not None,
+            "sqlite_pending": len(self._pending),
+        }
+
+    async def close(self) -> None:
+        self._flush()
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown)
+            self._pool = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
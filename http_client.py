@@ -0,0 +1,145 @@
+from __future__ import annotations
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from config import cfg
+
+USER_AGENT = "AIRealtorBot/2.0"
+
+
+class HttpClient:
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        per_host: int = 20,
+        keepalive: float = 30.0,
+        dns_ttl: int = 300,
+        timeout: float = 25.0,
+        connect_timeout: float = 10.0,
+        user_agent: str = USER_AGENT,
+    ):
+        self.pool_size = max(0, pool_size)
+        self.per_host = max(0, per_host)
+        self.keepalive = keepalive
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.user_agent = user_agent
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.counts: Dict[str, int] = {
+            "requests": 0,
+            "active": 0,
+            "failed": 0,
+            "connections": 0,
+            "reused": 0,
+            "queued": 0,
+            "dns_hits": 0,
+            "dns_misses": 0,
+        }
+        self.queued_seconds = 0.0
+
+    @classmethod
+    def from_cfg(cls, user_agent: str = USER_AGENT) -> "HttpClient":
+        return cls(
+            pool_size=cfg.http_pool_size,
+            per_host=cfg.http_pool_per_host,
+            keepalive=cfg.http_keepalive,
+            dns_ttl=cfg.http_dns_ttl,
+            timeout=cfg.http_timeout,
+            connect_timeout=cfg.http_connect_timeout,
+            user_agent=user_agent,
+        )
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        counts = self.counts
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            counts["requests"] += 1
+            counts["active"] += 1
+
+        async def on_request_end(session, ctx, params):
+            counts["active"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            counts["active"] -= 1
+            counts["failed"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            counts["connections"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            counts["reused"] += 1
+
+        async def on_queued_start(session, ctx, params):
+            counts["queued"] += 1
+            ctx.queued_at = time.monotonic()
+
+        async def on_queued_end(session, ctx, params):
+            self.queued_seconds += time.monotonic() - getattr(ctx, "queued_at", time.monotonic())
+
+        async def on_dns_hit(session, ctx, params):
+            counts["dns_hits"] += 1
+
+        async def on_dns_miss(session, ctx, params):
+            counts["dns_misses"] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
+
+    async def start(self) -> aiohttp.ClientSession:
+        return await self.session()
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host,
+                keepalive_timeout=self.keepalive,
+                use_dns_cache=self.dns_ttl > 0,
+                ttl_dns_cache=self.dns_ttl if self.dns_ttl > 0 else None,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers={"User-Agent": self.user_agent},
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        idle: Optional[int] = None
+        if self._session is not None and not self._session.closed:
+            # aiohttp has no public counter for idle keep-alive sockets; report
+            # none rather than fail if a release changes the private map
+            conns = getattr(self._session.connector, "_conns", None)
+            if isinstance(conns, dict):
+                try:
+                    idle = sum(len(v) for v in conns.values())
+                except TypeError:
+                    idle = None
+        return {
+            "pool_size": self.pool_size,
+            "per_host": self.per_host,
+            "idle": idle,
+            "queued_seconds": round(self.queued_seconds, 3),
+            **self.counts,
+        }
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+try:
+    from PIL import Image, ImageOps  # type: ignore
+except Exception:
+    Image = None
+    ImageOps = None
+
+# Telegram keeps at most 1280px on the long side for photos
+TELEGRAM_MAX_SIDE = 1280
+SMALL_ENOUGH_BYTES = 200 * 1024
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+def shrink_image(data: bytes, max_side: int, quality: int) -> Optional[bytes]:
+    with Image.open(io.BytesIO(data)) as img:
+        if max(img.size) <= max_side and len(data) <= SMALL_ENOUGH_BYTES:
+            return None
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    res = out.getvalue()
+    return res if len(res) < len(data) else None
+
+
+def photo_filename(url: str, data: bytes) -> str:
+    name = url.split("?", 1)[0].split("/")[-1] or "photo.jpg"
+    # a shrunk photo is a JPEG whatever the url says
+    if data[:3] == JPEG_MAGIC and not name.lower().endswith((".jpg", ".jpeg")):
+        name = name.rsplit(".", 1)[0] + ".jpg"
+    return name
+
+
+class ImageShrinker:
+
+    def __init__(self, enabled: bool = True, max_side: int = TELEGRAM_MAX_SIDE, quality: int = 82, workers: int = 2):
+        if enabled and Image is None:
+            print("[PHOTOS] IMAGE_SHRINK is on but Pillow is not installed; photos are sent as downloaded")
+        self.enabled = bool(enabled and Image is not None)
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.shrunk = 0
+        self.bytes_saved = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def process(self, data: bytes) -> Optional[bytes]:
+        if not self.enabled or not data:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            smaller = await loop.run_in_executor(self._get_pool(), shrink_image, data, self.max_side, self.quality)
+        except Exception as e:
+            print(f"[PHOTOS] shrink failed: {e}")
+            return None
+        if smaller:
+            self.shrunk += 1
+            self.bytes_saved += len(data) - len(smaller)
+        return smaller
+
+    def stats(self) -> Dict[str, int]:
+        return {"shrunk": self.shrunk, "bytes_saved": self.bytes_saved}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
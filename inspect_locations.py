@@ -28,9 +28,7 @@ async def main():
     print("\nRaw JSON (до ~1000 символів):")
     print(json.dumps(data, ensure_ascii=False, indent=2)[:1000])
 
-    sess = getattr(api, "_session", None)
-    if sess and not sess.closed:
-        await sess.close()
+    await api.close()
 
 
 if __name__ == "__main__":
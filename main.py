@@ -2,7 +2,9 @@ from __future__ import annotations
 import asyncio
 import random
 import re
-from typing import Dict, Any, List, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode, ChatAction
@@ -13,14 +15,19 @@ from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InputMediaPhoto, BufferedInputFile
 )
 
-import aiohttp
-
 from config import cfg, validate_config
 from sheets_client import SheetsClient, append_booking
-from api_client import ListingsAPI
+from api_client import Listing, ListingsAPI, canonical_filters, photo_key, photo_urls
+from http_client import HttpClient
 from supabase_client import SupabaseClient
+from media_cache import FileIdCache, ImageCache
+from image_processing import ImageShrinker, photo_filename
 from parsers import (
+    ParsedText,
     parse_free_text,
+    SlotPatterns,
+    literal_patterns,
+    norm_folded,
     DISTRICT_LABELS,
     MICROAREA_LABELS,
 )
@@ -31,8 +38,21 @@ bot = Bot(token=cfg.bot_token, default=DefaultBotProperties(parse_mode=ParseMode
 dp = Dispatcher()
 
 sheets = SheetsClient(cfg.sheets_id)
-api = ListingsAPI()
+http = HttpClient.from_cfg()
+api = ListingsAPI(http)
 supa = SupabaseClient()
+photo_file_ids = FileIdCache(cfg.file_id_cache_path, max_entries=cfg.file_id_cache_size)
+image_cache = ImageCache(
+    cfg.image_cache_dir,
+    max_bytes=cfg.image_cache_max_mb * 1024 * 1024,
+    fresh_seconds=cfg.image_cache_fresh_seconds,
+)
+image_shrinker = ImageShrinker(
+    enabled=cfg.image_shrink,
+    max_side=cfg.image_max_side,
+    quality=cfg.image_jpeg_quality,
+    workers=cfg.image_workers,
+)
 
 WELCOME_AFTER_NAME = "Дуже приємно познайомитись, {name}. Щоб бути максимально корисним для вас, я задам декілька запитань."
 
@@ -50,16 +70,8 @@ CANON: Dict[str, List[str]] = {
     "budget":    ["budget", "price_max", "max_price", "budget_max", "price"],
 }
 
-# aiohttp session for photos
-_http_session: Optional[aiohttp.ClientSession] = None
-
-async def _get_http() -> aiohttp.ClientSession:
-    global _http_session
-    if _http_session is None or _http_session.closed:
-        timeout = aiohttp.ClientTimeout(total=25)
-        headers = {"User-Agent": "AIRealtorBot/2.0", "Accept": "*/*"}
-        _http_session = aiohttp.ClientSession(timeout=timeout, headers=headers)
-    return _http_session
+MAX_PHOTOS_PER_LISTING = 10
+_PHOTO_HEADERS = {"Accept": "*/*"}
 
 # helpers
 async def _typing(msg: Message, min_s: float = 2.0, max_s: float = 3.0):
@@ -122,65 +134,40 @@ def _bulleted(keys: List[str]) -> str:
             lines.append(f"• {q}")
     return "\n".join(lines)
 
-def _norm_simple(s: str) -> str:
-    s = (s or "").lower().strip()
-    repl = {
-        "ё": "е",
-        "ї": "и",
-        "і": "и",
-        "є": "е",
-        "ґ": "г",
-        "ъ": "",
-        "ь": "",
-    }
-    for a, b in repl.items():
-        s = s.replace(a, b)
-    s = re.sub(r"[.,;:!?()\[\]\-_/\\]+", " ", s)
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-def _detect_condition_value(text: str) -> Optional[int]:
-    norm = _norm_simple(text)
-    if not norm:
-        return None
-
-    POSITIVE_TOKENS = [
-        "з ремонтом", "с ремонтом",
-        "новый ремонт", "новий ремонт",
-        "свежий ремонт", "качественный ремонт",
-        "капремонт", "капитальный ремонт",
-        "отличный ремонт", "евроремонт",
-    ]
-
-    NEGATIVE_TOKENS = [
-        "без ремонта", "без ремонту",
-        "после строител", "після буд",
-        "состояние от строителей", "сост от строителей",
-        "от строителей",
-        "чернов", "чорнов",
-        "под ремонт", "под ремонт",
-    ]
-
-    pos = any(t in norm for t in POSITIVE_TOKENS)
-    neg = any(t in norm for t in NEGATIVE_TOKENS)
+_POSITIVE_CONDITION_TOKENS = [
+    "з ремонтом", "с ремонтом",
+    "новый ремонт", "новий ремонт",
+    "свежий ремонт", "качественный ремонт",
+    "капремонт", "капитальный ремонт",
+    "отличный ремонт", "евроремонт",
+]
+
+_NEGATIVE_CONDITION_TOKENS = [
+    "без ремонта", "без ремонту",
+    "после строител", "після буд",
+    "состояние от строителей", "сост от строителей",
+    "от строителей",
+    "чернов", "чорнов",
+    "под ремонт",
+]
+
+# lookahead so one finditer pass reports every start position of every token
+_CONDITION_TOKENS_RE = re.compile(
+    "(?=(?:(?P<pos>" + "|".join(map(re.escape, _POSITIVE_CONDITION_TOKENS)) + ")"
+    "|(?P<neg>" + "|".join(map(re.escape, _NEGATIVE_CONDITION_TOKENS)) + ")))"
+)
 
-    if pos and not neg:
-        return 8
-    if neg and not pos:
-        return 9
-    if not pos and not neg:
+def _detect_condition_value(text: Any) -> Optional[int]:
+    norm = ParsedText.of(text).folded
+    if not norm:
         return None
 
-    def last_index(tokens: List[str]) -> int:
-        idx = -1
-        for t in tokens:
-            i = norm.rfind(t)
-            if i > idx:
-                idx = i
-        return idx
-
-    last_pos = last_index(POSITIVE_TOKENS) if pos else -1
-    last_neg = last_index(NEGATIVE_TOKENS) if neg else -1
+    last_pos = last_neg = -1
+    for m in _CONDITION_TOKENS_RE.finditer(norm):
+        if m.lastgroup == "pos":
+            last_pos = m.start()
+        else:
+            last_neg = m.start()
 
     if last_pos > last_neg:
         return 8
@@ -190,24 +177,26 @@ def _detect_condition_value(text: str) -> Optional[int]:
 
 
 
-def _detect_location_ids(norm_text: str) -> Dict[str, int]:
-    res: Dict[str, int] = {}
+def _label_stems(labels: Dict[int, str]) -> List[tuple]:
+    out = []
+    for raw_id, label in (labels or {}).items():
+        if not isinstance(label, str):
+            continue
+        stems = [(t[:4], t[:5]) for t in norm_folded(label).split() if len(t) >= 4]
+        out.append((raw_id, stems))
+    return out
 
-    def match_from_labels(labels: Dict[int, str], target_key: str) -> bool:
-        for raw_id, label in (labels or {}).items():
-            if not isinstance(label, str):
-                continue
 
-            ln = _norm_simple(label)
-            tokens = [t for t in ln.split() if t]
+_MICROAREA_STEMS = _label_stems(MICROAREA_LABELS)
+_DISTRICT_STEMS = _label_stems(DISTRICT_LABELS)
 
-            for token in tokens:
-                if len(token) < 4:
-                    continue
 
-                base4 = token[:4]
-                base5 = token[:5]
+def _detect_location_ids(norm_text: str) -> Dict[str, int]:
+    res: Dict[str, int] = {}
 
+    def match_from_labels(labels: List[tuple], target_key: str) -> bool:
+        for raw_id, stems in labels:
+            for base4, base5 in stems:
                 if (base5 and base5 in norm_text) or (base4 and base4 in norm_text):
                     try:
                         res[target_key] = int(raw_id)
@@ -217,14 +206,14 @@ def _detect_location_ids(norm_text: str) -> Dict[str, int]:
         return False
 
     try:
-        if match_from_labels(MICROAREA_LABELS, "microarea_id"):
+        if match_from_labels(_MICROAREA_STEMS, "microarea_id"):
             return res
     except Exception as e:
         if cfg.debug:
             print(f"[location] microarea match error: {e}")
 
     try:
-        if match_from_labels(DISTRICT_LABELS, "district_id"):
+        if match_from_labels(_DISTRICT_STEMS, "district_id"):
             return res
     except Exception as e:
         if cfg.debug:
@@ -233,17 +222,47 @@ def _detect_location_ids(norm_text: str) -> Dict[str, int]:
     return res
 
 
+def _any_of(*words: str) -> "re.Pattern":
+    return re.compile("|".join(literal_patterns(*words)))
+
+
+_ANSWER_BUDGET_K_RE = re.compile(r"(\d+)\s*([kк]|тис|тыс)")
+_ANSWER_BUDGET_DIGITS_RE = re.compile(r"(\d[\d\s]{3,})")
+_CHEAPER_RE = _any_of("дешевш", "дешевл", "дешев", "дешевее", "дешевле")
+_DEARER_RE = _any_of("дорожч", "дороже", "подороже")
+_ANSWER_ROOMS_RE = re.compile(r"\b(\d+)\s*(к|комн|комнат|кімн|комнаты)\b")
+_ANSWER_ROOM_WORDS = SlotPatterns([
+    (1, literal_patterns("однокімнат", "однокомнат", "одн комнат", "одно кімнат")),
+    (2, literal_patterns("двокімнат", "двухкомнат", "двух комнат", "две комнат", "двохкімнат")),
+    (3, literal_patterns("трикімнат", "трьохкімнат", "трехкомнат", "три комнат")),
+    (2, literal_patterns("двушка", "двушк", "двойк", "двоечк")),
+    (3, literal_patterns("трешка", "трьошк", "трешк", "трёшк")),
+])
+_CONDITION_HINT_RE = _any_of(
+    "ремонт", "без ремонт", "без ремонта",
+    "чернов", "чорнов",
+    "під ремонт", "под ремонт",
+    "після будівель", "после строител",
+    "от строител", "від будівельник", "вид будівельник",
+    "отделоч", "оздоблювальн",
+    "евроремонт", "євроремонт",
+)
+_HOUSE_HINT_RE = _any_of("дом", "будинок", "частный дом", "частн дом")
+_APARTMENT_HINT_RE = _any_of("квартир", "апартам", "квартира")
+
+
 def _parse_into_answers(
     text: str,
     answers: Dict[str, Any],
     old_filters: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     out = dict(answers or {})
-    norm = _norm_simple(text)
+    pt = ParsedText(text)
+    norm = pt.folded
 
     found: Dict[str, Any] = {}
     try:
-        found = parse_free_text(text) or {}
+        found = parse_free_text(pt) or {}
     except Exception as e:
         if cfg.debug:
             print(f"[parse_free_text] error: {e}")
@@ -279,7 +298,7 @@ def _parse_into_answers(
 
     if not out.get("budget") and not out.get("price_max"):
         val = None
-        m = re.search(r"(\d+)\s*([kк]|тис|тыс)", norm)
+        m = _ANSWER_BUDGET_K_RE.search(norm)
         if m:
             try:
                 val = int(m.group(1)) * 1000
@@ -287,7 +306,7 @@ def _parse_into_answers(
                 val = None
 
         if val is None:
-            m2 = re.search(r"(\d[\d\s]{3,})", text)
+            m2 = _ANSWER_BUDGET_DIGITS_RE.search(text)
             if m2:
                 try:
                     raw = re.sub(r"\s+", "", m2.group(1))
@@ -301,15 +320,15 @@ def _parse_into_answers(
     if old_filters and (not out.get("budget") and not out.get("price_max")):
         old_b = old_filters.get("price_max")
         if isinstance(old_b, (int, float)) and old_b > 0:
-            if any(w in norm for w in ["дешевш", "дешевл", "дешев", "дешевее", "дешевле"]):
+            if _CHEAPER_RE.search(norm):
                 out["budget"] = int(old_b * 0.9)
-            elif any(w in norm for w in ["дорожч", "дороже", "подороже"]):
+            elif _DEARER_RE.search(norm):
                 out["budget"] = int(old_b * 1.1)
 
     if not out.get("rooms_in") and not out.get("rooms"):
         rooms_val: Optional[int] = None
 
-        m = re.search(r"\b(\d+)\s*(к|комн|комнат|кімн|комнаты)\b", norm)
+        m = _ANSWER_ROOMS_RE.search(norm)
         if m:
             try:
                 rooms_val = int(m.group(1))
@@ -317,18 +336,9 @@ def _parse_into_answers(
                 rooms_val = None
 
         if rooms_val is None:
-            if any(sub in norm for sub in ["однокімнат", "однокомнат", "одн комнат", "одно кімнат"]):
-                rooms_val = 1
-            elif any(sub in norm for sub in ["двокімнат", "двухкомнат", "двух комнат", "две комнат", "двохкімнат"]):
-                rooms_val = 2
-            elif any(sub in norm for sub in ["трикімнат", "трьохкімнат", "трехкомнат", "три комнат"]):
-                rooms_val = 3
-
-        if rooms_val is None:
-            if any(w in norm for w in ["двушка", "двушк", "двойк", "двоечк"]):
-                rooms_val = 2
-            elif any(w in norm for w in ["трешка", "трьошк", "трешк", "трёшк"]):
-                rooms_val = 3
+            hit = _ANSWER_ROOM_WORDS.best(norm)
+            if hit:
+                rooms_val = hit[0]
 
         if rooms_val is not None:
             out["rooms_in"] = rooms_val
@@ -339,25 +349,15 @@ def _parse_into_answers(
         for k, v in loc_ids.items():
             out[k] = v
 
-    condition_keywords = [
-        "ремонт", "без ремонт", "без ремонта",
-        "чернов", "чорнов",
-        "під ремонт", "под ремонт",
-        "після будівель", "после строител",
-        "от строител", "від будівельник", "вид будівельник",
-        "отделоч", "оздоблювальн",
-        "евроремонт", "євроремонт",
-    ]
-
-    if any(w in norm for w in condition_keywords):
-        ci = _detect_condition_value(text)
+    if _CONDITION_HINT_RE.search(norm):
+        ci = _detect_condition_value(pt)
         if ci is not None:
             out["condition_in"] = ci
 
     if not out.get("type"):
-        if any(w in norm for w in ["дом", "будинок", "частный дом", "частн дом"]):
+        if _HOUSE_HINT_RE.search(norm):
             out["type"] = "house"
-        elif any(w in norm for w in ["квартир", "апартам", "квартира"]):
+        elif _APARTMENT_HINT_RE.search(norm):
             out["type"] = "apartment"
 
     return out
@@ -501,39 +501,13 @@ def _filters_diff_human(new: Dict[str, Any]) -> Optional[str]:
     return ", ".join(parts)
 
 
-def _format_address(item: Dict[str, Any]) -> Optional[str]:
-    for k in ("address", "location", "addr"):
-        if isinstance(item.get(k), str) and item[k].strip():
-            return item[k].strip()
-    addr = item.get("address")
-    if isinstance(addr, dict):
-        city = addr.get("city")
-        street = " ".join(x for x in (addr.get("street_type"), addr.get("street")) if x)
-        house = addr.get("house") or addr.get("house_number")
-        parts = [p for p in (city, street, house) if p]
-        if parts:
-            return ", ".join(parts)
-    return None
-
-def _item_text_blob(item: Dict[str, Any]) -> str:
-    parts: List[str] = []
-
-    for key in ("title", "name", "headline"):
-        v = item.get(key)
-        if isinstance(v, str) and v.strip():
-            parts.append(v.strip())
-
-    addr = _format_address(item)
-    if addr:
-        parts.append(addr)
-
-    for key in ("description", "short_description", "body", "comment", "notes"):
-        v = item.get(key)
-        if isinstance(v, str) and v.strip():
-            parts.append(v.strip())
+def _format_address(item: Listing) -> Optional[str]:
+    return item.address
 
+def _item_text_blob(item: Listing) -> str:
+    parts = item.headings + ([item.address] if item.address else []) + item.notes
     blob = "\n".join(parts)
-    return _norm_simple(blob)
+    return norm_folded(blob)
 
 
 def _has_repair(blob_norm: str) -> bool:
@@ -555,94 +529,162 @@ def _is_without_repair(blob_norm: str) -> bool:
     ]
     return any(p in blob_norm for p in patterns)
 
-def _extract_description(item: Dict[str, Any]) -> Optional[str]:
-    candidates: List[str] = []
-
-    for key in (
-        "description",
-        "description_full",
-        "full_description",
-        "short_description",
-        "body",
-        "text",
-        "comment",
-        "note",
-    ):
-        val = item.get(key)
-        if isinstance(val, str):
-            s = val.strip()
-            if s:
-                candidates.append(s)
-
-    if not candidates:
-        for k, v in item.items():
-            if isinstance(v, str) and "descr" in k.lower():
-                s = v.strip()
-                if s:
-                    candidates.append(s)
-
-    if not candidates:
-        return None
-
-    desc = max(candidates, key=len)
-    return desc.strip()
-
-
-async def _try_fetch_bytes(url: str) -> Optional[bytes]:
+# (status, body, validators); status 304 means the cached copy behind `validators` is still good
+async def _try_fetch_bytes(
+    url: str, validators: Optional[Dict[str, str]] = None
+) -> Tuple[int, Optional[bytes], Dict[str, str]]:
+    headers: Dict[str, str] = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
     try:
-        sess = await _get_http()
-        async with sess.get(url, allow_redirects=True) as resp:
+        sess = await http.session()
+        async with sess.get(url, allow_redirects=True, headers={**_PHOTO_HEADERS, **headers}) as resp:
+            if resp.status == 304 and headers:
+                return 304, None, {}
+            got = {}
+            if resp.headers.get("ETag"):
+                got["etag"] = resp.headers["ETag"]
+            if resp.headers.get("Last-Modified"):
+                got["last_modified"] = resp.headers["Last-Modified"]
             ct = (resp.headers.get("Content-Type") or "").lower()
             if resp.status == 200 and ct.startswith("image/"):
-                return await resp.read()
+                return 200, await resp.read(), got
             if resp.status == 200 and not ct:
                 data = await resp.read()
                 if data and len(data) > 128:
-                    return data
+                    return 200, data, got
+            return resp.status, None, {}
     except Exception as e:
         if cfg.debug:
             print(f"[PHOTOS] fetch error {url}: {e}")
-    return None
+    return 0, None, {}
+
+def _photo_host(url: str) -> str:
+    return url.split("://", 1)[-1].split("/", 1)[0]
+
+
+_photo_host_sems: Dict[str, asyncio.Semaphore] = {}
 
-async def _fetch_first_n_photos(item: Dict[str, Any], max_count: int = 5) -> List[BufferedInputFile]:
-    files: List[BufferedInputFile] = []
-    cands = item.get("_photo_candidates") or []
-    used: set[str] = set()
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = _photo_host(url)
+    sem = _photo_host_sems.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(max(1, cfg.photo_host_concurrency))
+        _photo_host_sems[host] = sem
+    return sem
 
-    for url in cands:
-        if url in used:
+async def _fetch_photo(url: str, fallbacks: Optional[List[str]] = None) -> Optional[Tuple[str, bytes]]:
+    key = photo_key(url)
+    cached = image_cache.lookup(key)
+    if cached and image_cache.is_fresh(cached):
+        data = await image_cache.read(cached)
+        if data:
+            return url, data
+        cached = None
+
+    # each of the photo's urls in turn, and for each the learned storage base
+    # first; the other bases only if it doesn't have the photo
+    candidates: List[str] = []
+    for ref in [url] + list(fallbacks or []):
+        ref = photo_urls.rebase(ref)
+        candidates += [ref] + photo_urls.alternatives(ref)
+    for candidate in dict.fromkeys(candidates):
+        async with _host_semaphore(candidate):
+            status, b, validators = await _try_fetch_bytes(candidate, image_cache.validators(cached))
+        if status == 304 and cached:
+            data = await image_cache.read(cached)
+            if data:
+                photo_urls.learn(candidate)
+                image_cache.mark_checked(key, cached)
+                return candidate, data
+            cached = None
             continue
-        used.add(url)
-        b = await _try_fetch_bytes(url)
         if b:
-            name = url.split("/")[-1] or "photo.jpg"
-            files.append(BufferedInputFile(b, filename=name))
-            if len(files) >= max_count:
-                break
+            photo_urls.learn(candidate)
+            # the cache keeps the shrunk copy, so this runs once per photo
+            smaller = await image_shrinker.process(b)
+            if smaller:
+                if cfg.debug:
+                    print(f"[PHOTOS] shrunk {candidate}: {len(b)} -> {len(smaller)} bytes")
+                b = smaller
+            await image_cache.store(key, b, validators)
+            image_cache.maybe_save()
+            return candidate, b
+        photo_urls.failed(candidate, status)
+    if cached:
+        # no host answered; a stale copy beats no photo
+        data = await image_cache.read(cached)
+        if data:
+            return url, data
+    return None
+
+# (photo key, media) pairs; media is a cached Telegram file_id or freshly downloaded bytes
+async def _fetch_first_n_photos(item: Listing, max_count: int = 5) -> List[Tuple[str, Union[str, BufferedInputFile]]]:
+    photo_file_ids.sync_listing(item.id, [photo_key(u) for u in item.photos])
+
+    queue = iter(enumerate(item.photos))
+    pending: Dict[asyncio.Future, int] = {}
+    found: Dict[int, Tuple[str, Union[str, BufferedInputFile]]] = {}
+
+    def launch_next() -> None:
+        nxt = next(queue, None)
+        if nxt is None:
+            return
+        idx, url = nxt
+        key = photo_key(url)
+        fid = photo_file_ids.get(key)
+        if fid:
+            found[idx] = (key, fid)
+        else:
+            pending[asyncio.ensure_future(_fetch_photo(url, item.photo_fallbacks.get(url)))] = idx
+
+    # at most max_count photos in flight; a failed photo makes room for the next one
+    for _ in range(max_count):
+        launch_next()
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                idx = pending.pop(task)
+                got = task.result()
+                if got:
+                    url, b = got
+                    # keyed by the listed url even when a fallback answered
+                    found[idx] = (photo_key(item.photos[idx]), BufferedInputFile(b, filename=photo_filename(url, b)))
+                else:
+                    launch_next()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return [found[idx] for idx in sorted(found)]
+
+def _remember_file_ids(photos: List[Tuple[str, Any]], sent: List[Message]) -> None:
+    for (key, media), msg in zip(photos, sent):
+        if isinstance(media, str) or not msg or not msg.photo:
+            continue
+        photo_file_ids.put(key, msg.photo[-1].file_id)
+    photo_file_ids.maybe_save()
 
-    return files
+def _forget_file_ids(photos: List[Tuple[str, Any]]) -> None:
+    for key, media in photos:
+        if isinstance(media, str):
+            photo_file_ids.discard(key)
 
-def _format_caption(item: Dict[str, Any]) -> str:
+def _format_caption(item: Listing) -> str:
     caption_lines = []
 
-    title = item.get("title") or item.get("name") or item.get("headline") or "Об'єкт"
+    title = item.title or "Об'єкт"
     caption_lines.append(f"🏠 {title}")
 
     addr_str = _format_address(item)
     if addr_str:
         caption_lines.append(f"📍 {addr_str}")
 
-    price = None
-    if "price" in item and item["price"]:
-        price = item["price"]
-    elif "prices" in item and isinstance(item["prices"], dict):
-        p = item["prices"].get("value")
-        if p:
-            try:
-                price = f"${int(float(p)):,}".replace(",", " ")
-            except Exception:
-                price = str(p)
-
+    price = item.price
     if price:
         if not isinstance(price, str):
             try:
@@ -652,14 +694,14 @@ def _format_caption(item: Dict[str, Any]) -> str:
         caption_lines.append(f"💵 {price}")
 
     meta = []
-    rooms = item.get("rooms") or item.get("rooms_in") or item.get("roomCount")
+    rooms = item.rooms
     if rooms:
         try:
             meta.append(f"{int(rooms)}к")
         except Exception:
             meta.append(f"{rooms}к")
 
-    area = item.get("area_total") or item.get("area") or item.get("square")
+    area = item.area
     if area:
         try:
             area_val = float(area)
@@ -672,19 +714,11 @@ def _format_caption(item: Dict[str, Any]) -> str:
     if meta:
         caption_lines.append(" · ".join(meta))
 
-    if item.get("id"):
-        caption_lines.append(f"ID: {item['id']}")
+    if item.id:
+        caption_lines.append(f"ID: {item.id}")
 
-    import re
-
-    raw_desc_parts: List[str] = []
-    for key in ("description", "description_short", "body", "text"):
-        v = item.get(key)
-        if isinstance(v, str) and v.strip():
-            raw_desc_parts.append(v.strip())
-
-    if raw_desc_parts:
-        raw_desc = "\n".join(raw_desc_parts)
+    if item.description:
+        raw_desc = item.description
 
         raw_desc = re.sub(r'(?i)\b(id[:\-\s]*\d+)\b', '', raw_desc)
 
@@ -715,7 +749,185 @@ def _format_caption(item: Dict[str, Any]) -> str:
     return "\n".join(caption_lines)
 
 
-async def _show_three_results(message: Message, session: Dict[str, Any]) -> None:
+async def _send_listing(message: Message, text_out: str, photos: List[Tuple[str, Any]]) -> None:
+    if len(photos) > 1:
+        try:
+            media = [InputMediaPhoto(media=m) for _, m in photos]
+            sent = await message.answer_media_group(media)
+            _remember_file_ids(photos, sent)
+            await message.answer(text_out)
+        except Exception as e:
+            _forget_file_ids(photos)
+            if cfg.debug:
+                await message.answer(
+                    f"(DEBUG) media_group error: {e}\n"
+                )
+            try:
+                sent_one = await message.answer_photo(photos[0][1], caption=text_out)
+                _remember_file_ids(photos[:1], [sent_one])
+            except Exception as e2:
+                if cfg.debug:
+                    await message.answer(
+                        f"(DEBUG) photo error: {e2}\n"
+                    )
+                await message.answer(text_out)
+
+    elif len(photos) == 1:
+        try:
+            sent_one = await message.answer_photo(photos[0][1], caption=text_out)
+            _remember_file_ids(photos, [sent_one])
+        except Exception as e:
+            _forget_file_ids(photos)
+            if cfg.debug:
+                await message.answer(
+                    f"(DEBUG) photo error: {e}\n"
+                )
+            await message.answer(text_out)
+    else:
+        await message.answer(text_out)
+
+
+def _classify_item_condition(it: Listing) -> Optional[int]:
+    if it.condition is not None:
+        return it.condition
+    parts = it.headings + it.notes
+    if not parts:
+        return None
+    return _detect_condition_value(" ".join(parts))
+
+def _condition_matches(it: Listing, want_condition: Optional[int]) -> bool:
+    if want_condition not in (8, 9, 18):
+        return True
+    cond = _classify_item_condition(it)
+    if cond is None:
+        return True
+    if want_condition == 8 and cond in (9, 18):
+        return False
+    if want_condition in (9, 18) and cond == 8:
+        return False
+    return True
+
+async def _collect_page(
+    filters: Dict[str, Any],
+    want_condition: Optional[int],
+    offset: int,
+    limit: int,
+) -> Dict[str, Any]:
+    # the api can't filter by condition, so read a wider window and filter here;
+    # next_offset is the first upstream item the page did not consume
+    window = limit if want_condition not in (8, 9, 18) else max(limit, cfg.page_window)
+    page: List[Listing] = []
+    first_batch: Optional[List[Listing]] = None
+    total = 0
+    cursor = offset
+    next_offset = offset
+
+    for _ in range(max(1, cfg.page_max_windows)):
+        res = await api.get_apartments(filters, limit=window, offset=cursor)
+        batch = res.get("results") or []
+        total = int(res.get("total") or 0) or cursor + len(batch)
+        if first_batch is None:
+            first_batch = batch
+
+        for i, it in enumerate(batch):
+            if _condition_matches(it, want_condition):
+                page.append(it)
+                if len(page) >= limit:
+                    next_offset = cursor + i + 1
+                    break
+        if len(page) >= limit:
+            break
+        cursor += len(batch)
+        next_offset = cursor
+        if len(batch) < window or cursor >= total:
+            break
+
+    if not page and first_batch:
+        page = first_batch[:limit]
+        next_offset = offset + len(page)
+
+    return {"results": page, "total": total, "next_offset": next_offset}
+
+# where the next page starts per telegram user: (saved_at, filters key, page offset, next offset),
+# least recently saved first
+_page_cursors: "OrderedDict[int, Tuple[float, str, int, int]]" = OrderedDict()
+
+def _save_page_cursor(user_id: int, filters: Dict[str, Any], offset: int, next_offset: int) -> None:
+    now = time.monotonic()
+    _page_cursors[user_id] = (now, canonical_filters(filters), offset, next_offset)
+    _page_cursors.move_to_end(user_id)
+    while _page_cursors:
+        oldest = next(iter(_page_cursors.values()))
+        if len(_page_cursors) <= max(1, cfg.page_cursor_size) and now - oldest[0] <= cfg.page_cursor_ttl:
+            break
+        _page_cursors.popitem(last=False)
+
+def _next_page_offset(user_id: int, filters: Dict[str, Any], offset: int) -> int:
+    entry = _page_cursors.get(user_id)
+    if (entry and time.monotonic() - entry[0] <= cfg.page_cursor_ttl
+            and entry[1] == canonical_filters(filters) and entry[2] == offset):
+        return entry[3]
+    return offset + 3
+
+# next page per telegram user: (created_at, filters key, offset, task), oldest first
+_prefetched: "OrderedDict[int, Tuple[float, str, int, asyncio.Future]]" = OrderedDict()
+
+async def _prefetch_page(
+    filters: Dict[str, Any],
+    want_condition: Optional[int],
+    offset: int,
+    limit: int,
+) -> Dict[str, Any]:
+    res = await _collect_page(filters, want_condition, offset, limit)
+    # warm the photo caches so the page goes out without waiting on the image host
+    await asyncio.gather(
+        *(_fetch_first_n_photos(item, max_count=MAX_PHOTOS_PER_LISTING) for item in res["results"]),
+        return_exceptions=True,
+    )
+    return res
+
+def _cancel_prefetch(user_id: int) -> None:
+    entry = _prefetched.pop(user_id, None)
+    if entry:
+        entry[3].cancel()
+
+def _sweep_prefetched() -> None:
+    now = time.monotonic()
+    while _prefetched:
+        uid, oldest = next(iter(_prefetched.items()))
+        if len(_prefetched) <= max(1, cfg.prefetch_max) and now - oldest[0] <= cfg.prefetch_ttl:
+            break
+        _cancel_prefetch(uid)
+
+def _schedule_prefetch(
+    user_id: int,
+    filters: Dict[str, Any],
+    want_condition: Optional[int],
+    offset: int,
+    limit: int,
+) -> None:
+    _cancel_prefetch(user_id)
+    task = asyncio.ensure_future(_prefetch_page(filters, want_condition, offset, limit))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _prefetched[user_id] = (time.monotonic(), canonical_filters(filters), offset, task)
+    _sweep_prefetched()
+
+def _take_prefetch(user_id: int, filters: Dict[str, Any], offset: int) -> Optional[asyncio.Future]:
+    entry = _prefetched.pop(user_id, None)
+    _sweep_prefetched()
+    if not entry:
+        return None
+    created, key, off, task = entry
+    if key != canonical_filters(filters) or off != offset or time.monotonic() - created > cfg.prefetch_ttl:
+        task.cancel()
+        return None
+    return task
+
+async def _show_three_results(
+    message: Message,
+    session: Dict[str, Any],
+    prefetched: Optional[asyncio.Future] = None,
+) -> None:
     limit = 3
     offset = int(session.get("page_offset", 0))
     filters = session.get("filters") or {}
@@ -724,8 +936,16 @@ async def _show_three_results(message: Message, session: Dict[str, Any]) -> None
     answers = (last.get("answers") or {}) if isinstance(last, dict) else {}
     want_condition = answers.get("condition_in")
 
+    res = None
+    if prefetched is not None:
+        try:
+            res = await prefetched
+        except Exception:
+            res = None
+
     try:
-        res = await api.get_apartments(filters, limit=limit, offset=offset)
+        if res is None:
+            res = await _collect_page(filters, want_condition, offset, limit)
     except RuntimeError as e:
         if cfg.debug:
             await message.answer(f"(DEBUG) API error: {e}")
@@ -736,10 +956,11 @@ async def _show_three_results(message: Message, session: Dict[str, Any]) -> None
             )
         return
 
-    items = res.get("results") or []
-    total = int(res.get("total") or len(items) or 0)
+    page = res["results"]
+    total = res["total"]
+    next_offset = res["next_offset"]
 
-    if not items:
+    if not page:
         await _typing(message)
         await message.answer(
             "Поки немає варіантів за цими параметрами. "
@@ -747,98 +968,45 @@ async def _show_three_results(message: Message, session: Dict[str, Any]) -> None
         )
         return
 
-    def classify_item_condition(it: Dict[str, Any]) -> Optional[int]:
-        for key in ("condition_in", "condition_id", "condition"):
-            raw = it.get(key)
-            if isinstance(raw, int):
-                return raw
-            if isinstance(raw, str):
-                m = re.search(r"\d+", raw)
-                if m:
-                    try:
-                        return int(m.group(0))
-                    except Exception:
-                        pass
-
-        parts: List[str] = []
-        for key in ("title", "name", "headline",
-                    "description", "short_description",
-                    "body", "comment", "notes"):
-            v = it.get(key)
-            if isinstance(v, str) and v.strip():
-                parts.append(v.strip())
-        if not parts:
-            return None
-        return _detect_condition_value(" ".join(parts))
-
-    filtered_items: List[Dict[str, Any]] = []
-    for it in items:
-        if want_condition in (8, 9, 18):
-            cond = classify_item_condition(it)
-            if cond is not None:
-                if want_condition == 8 and cond in (9, 18):
-                    continue
-                if want_condition in (9, 18) and cond == 8:
-                    continue
-        filtered_items.append(it)
-
-    used_items: List[Dict[str, Any]] = filtered_items or items
-
-    sent = 0
-    for item in used_items[:limit]:
-        caption = _format_caption(item)
+    user_id = message.from_user.id
+    _save_page_cursor(user_id, filters, offset, next_offset)
 
-        text_out = caption
-
-        photos_files = await _fetch_first_n_photos(item, max_count=20)
-        if len(photos_files) > 2:
-            photos_files = photos_files[::2]
-        photos_files = photos_files[:10]
-
-        if len(photos_files) > 1:
-            try:
-                media = [InputMediaPhoto(media=f) for f in photos_files]
-                await message.answer_media_group(media)
-                await message.answer(text_out)
-            except Exception as e:
-                if cfg.debug:
-                    await message.answer(
-                        f"(DEBUG) media_group error: {e}\n"
-                    )
-                try:
-                    await message.answer_photo(photos_files[0], caption=text_out)
-                except Exception as e2:
-                    if cfg.debug:
-                        await message.answer(
-                            f"(DEBUG) photo error: {e2}\n"
-                        )
-                    await message.answer(text_out)
-
-        elif len(photos_files) == 1:
-            try:
-                await message.answer_photo(photos_files[0], caption=text_out)
-            except Exception as e:
-                if cfg.debug:
-                    await message.answer(
-                        f"(DEBUG) photo error: {e}\n"
-                    )
-                await message.answer(text_out)
-        else:
-            await message.answer(text_out)
+    # fetch photos for the whole page at once, send in order as each one is ready
+    fetches = [
+        asyncio.ensure_future(_fetch_first_n_photos(item, max_count=MAX_PHOTOS_PER_LISTING))
+        for item in page
+    ]
 
-        sent += 1
+    try:
+        for item, fetch in zip(page, fetches):
+            photos = await fetch
+            await _send_listing(message, _format_caption(item), photos)
+    finally:
+        for fetch in fetches:
+            fetch.cancel()
 
-    remain = max(0, total - (offset + sent))
+    remain = max(0, total - next_offset)
     if remain > 0:
+        _schedule_prefetch(user_id, filters, want_condition, next_offset, limit)
         await _typing(message)
         await message.answer(
             f"Є ще приблизно <b>{remain}</b> схожих об’єктів. "
             f"Напишіть «Ще» — пришлю наступні 3 😉"
         )
 
+# one session scope per incoming message: a user's messages are handled one at
+# a time and each handler's session patches reach the database as one update
+@dp.message.middleware()
+async def _session_scope_middleware(handler, event: Message, data: Dict[str, Any]) -> Any:
+    if event.from_user is None:
+        return await handler(event, data)
+    async with supa.session_scope(event.from_user.id):
+        return await handler(event, data)
+
 @dp.message(CommandStart())
 async def on_start(message: Message):
     _ensure_loaded()
+    _cancel_prefetch(message.from_user.id)
     await supa.get_or_create_user(message.from_user)
     session = await supa.get_or_create_session(message.from_user.id)
 
@@ -846,8 +1014,8 @@ async def on_start(message: Message):
     await message.answer(welcome)
 
     try:
-        user = await supa.get_or_create_user_obj(message.from_user.id)
-        await supa.append_message(session_id=session["id"], user_uuid=user["id"], direction="out", text=welcome)
+        user_uuid = await supa.get_user_id(message.from_user.id)
+        await supa.append_message(session_id=session["id"], user_uuid=user_uuid, direction="out", text=welcome)
     except Exception:
         pass
 
@@ -909,10 +1077,12 @@ async def on_contact(message: Message):
 @dp.message(F.text.regexp(r"^(ще|еще)$", flags=re.I))
 async def on_more(message: Message):
     session = await supa.get_or_create_session(message.from_user.id)
-    new_offset = int(session.get("page_offset", 0)) + 3
+    filters = session.get("filters") or {}
+    new_offset = _next_page_offset(message.from_user.id, filters, int(session.get("page_offset", 0)))
+    prefetched = _take_prefetch(message.from_user.id, filters, new_offset)
     session = await supa.patch_session(session["id"], {"page_offset": new_offset})
     await _typing(message)
-    await _show_three_results(message, session)
+    await _show_three_results(message, session, prefetched=prefetched)
 
 _INTENT_VIEW_RE = re.compile(r"(перегляд|показ|на\s+перегляд|зустріч)", re.I)
 
@@ -1075,10 +1245,10 @@ async def on_text(message: Message):
     old_filters = session.get("filters") or {}
 
     try:
-        user = await supa.get_or_create_user_obj(message.from_user.id)
+        user_uuid = await supa.get_user_id(message.from_user.id)
         await supa.append_message(
             session_id=session["id"],
-            user_uuid=user["id"],
+            user_uuid=user_uuid,
             direction="in",
             text=text_in
         )
@@ -1105,6 +1275,7 @@ async def on_text(message: Message):
     contact_received = bool(session.get("contact_received"))
 
     if contact_received:
+        _cancel_prefetch(message.from_user.id)
         filters = _filters_from_answers(answers)
         diff_str = _filters_diff_human(old_filters, filters)
 
@@ -1142,10 +1313,10 @@ async def on_text(message: Message):
             reply_markup=kb,
         )
         try:
-            user = await supa.get_or_create_user_obj(message.from_user.id)
+            user_uuid = await supa.get_user_id(message.from_user.id)
             await supa.append_message(
                 session_id=session["id"],
-                user_uuid=user["id"],
+                user_uuid=user_uuid,
                 direction="out",
                 text="ask_contact",
             )
@@ -1158,14 +1329,25 @@ async def on_text(message: Message):
 
 
 async def main():
+    await http.start()
     try:
         await dp.start_polling(bot)
     finally:
+        # supabase first: it still has queued message writes to flush
         try:
-            if _http_session and not _http_session.closed:
-                await _http_session.close()
-        except Exception:
-            pass
+            await supa.close()
+        except Exception as e:
+            print(f"[shutdown] supabase close failed: {e}")
+        photo_file_ids.save()
+        image_cache.save()
+        image_shrinker.close()
+        print(f"[HTTP] pool stats: {http.stats()}")
+        print(f"[PHOTOS] shrink stats: {image_shrinker.stats()}")
+        for name, close in (("api", api.close), ("http", http.close)):
+            try:
+                await close()
+            except Exception as e:
+                print(f"[shutdown] {name} close failed: {e}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,285 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _unlink_all(paths: List[Path]) -> None:
+    for p in paths:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+class FileIdCache:
+
+    def __init__(self, path: str, max_entries: int = 20000, save_interval: float = 60.0):
+        self.path = Path(path)
+        self.max_entries = max(1, max_entries)
+        self.save_interval = save_interval
+
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._listings: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            if not self.path.exists():
+                return
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            for k, v in (data.get("file_ids") or {}).items():
+                if isinstance(k, str) and isinstance(v, str):
+                    self._file_ids[k] = v
+            for k, v in (data.get("listings") or {}).items():
+                if isinstance(v, list):
+                    self._listings[str(k)] = [str(x) for x in v]
+            self._evict()
+        except Exception:
+            self._file_ids.clear()
+            self._listings.clear()
+
+    def _evict(self) -> None:
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.popitem(last=False)
+        while len(self._listings) > self.max_entries:
+            self._listings.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        fid = self._file_ids.get(key)
+        if fid is not None:
+            self._file_ids.move_to_end(key)
+        return fid
+
+    def put(self, key: str, file_id: str) -> None:
+        if not key or not file_id:
+            return
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        self._evict()
+        self._dirty = True
+
+    def discard(self, key: str) -> None:
+        if self._file_ids.pop(key, None) is not None:
+            self._dirty = True
+
+    def sync_listing(self, listing_id: Optional[object], keys: List[str]) -> None:
+        if listing_id in (None, ""):
+            return
+        lid = str(listing_id)
+        old = self._listings.get(lid)
+        if old is not None and old != keys:
+            for key in old:
+                self._file_ids.pop(key, None)
+        if old != keys:
+            self._listings[lid] = list(keys)
+            self._dirty = True
+        self._listings.move_to_end(lid)
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._file_ids), "listings": len(self._listings)}
+
+    def maybe_save(self) -> None:
+        if self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        data = {"file_ids": dict(self._file_ids), "listings": dict(self._listings)}
+        try:
+            _atomic_write_bytes(self.path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+            self._dirty = False
+        except Exception as e:
+            print(f"[media_cache] file_id cache save failed: {e}")
+        self._saved_at = time.monotonic()
+
+
+class ImageCache:
+
+    def __init__(self, root: str, max_bytes: int, fresh_seconds: int = 86400, save_interval: float = 60.0):
+        self.root = Path(root)
+        self.max_bytes = max(0, max_bytes)
+        self.fresh_seconds = fresh_seconds
+        self.save_interval = save_interval
+
+        # photo key (url without host) -> {"hash", "etag", "last_modified", "checked"}
+        self._index: Dict[str, Dict[str, Any]] = {}
+        # content hash -> size, least recently used first
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._writes: Dict[str, asyncio.Future] = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        self._load()
+
+    @property
+    def _index_path(self) -> Path:
+        return self.root / "index.json"
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / digest
+
+    def _load(self) -> None:
+        found = []
+        try:
+            for sub in (self.root / "blobs").glob("*/*"):
+                if sub.is_file() and not sub.name.startswith("."):
+                    st = sub.stat()
+                    found.append((st.st_mtime, sub.name, st.st_size))
+        except Exception:
+            found = []
+        for _, digest, size in sorted(found):
+            self._blobs[digest] = size
+            self._total += size
+
+        try:
+            if self._index_path.exists():
+                with self._index_path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._index = {k: v for k, v in data.items()
+                                   if isinstance(v, dict) and v.get("hash") in self._blobs}
+        except Exception:
+            self._index = {}
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if entry.get("hash") not in self._blobs:
+            self._index.pop(key, None)
+            return None
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - float(entry.get("checked") or 0) < self.fresh_seconds
+
+    def validators(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        if not entry:
+            return {}
+        return {k: entry[k] for k in ("etag", "last_modified") if entry.get(k)}
+
+    async def read(self, entry: Dict[str, Any]) -> Optional[bytes]:
+        digest = entry.get("hash")
+        if digest not in self._blobs:
+            return None
+        path = self._blob_path(digest)
+
+        def _read() -> Optional[bytes]:
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+                return data
+            except OSError:
+                return None
+
+        data = await asyncio.to_thread(_read)
+        if data is None:
+            self._drop_blob(digest)
+            self.misses += 1
+            return None
+        self._blobs.move_to_end(digest)
+        self.hits += 1
+        return data
+
+    def mark_checked(self, key: str, entry: Dict[str, Any]) -> None:
+        entry["checked"] = time.time()
+        self._index[key] = entry
+        self.revalidated += 1
+        self._dirty = True
+
+    async def store(self, key: str, data: bytes, validators: Optional[Dict[str, str]] = None) -> None:
+        self.misses += 1
+        if not data or len(data) > self.max_bytes:
+            return
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self._blobs:
+            # the same photo often arrives under several urls at once; write it once
+            write = self._writes.get(digest)
+            if write is None:
+                write = asyncio.ensure_future(self._write_blob(digest, data))
+                self._writes[digest] = write
+                write.add_done_callback(lambda _: self._writes.pop(digest, None))
+            if not await asyncio.shield(write) or digest not in self._blobs:
+                return
+        self._blobs.move_to_end(digest)
+
+        entry: Dict[str, Any] = {"hash": digest, "checked": time.time()}
+        entry.update(validators or {})
+        self._index[key] = entry
+        self._dirty = True
+
+        victims: List[Path] = []
+        while self._total > self.max_bytes and self._blobs:
+            victims.append(self._forget_blob(next(iter(self._blobs))))
+        if victims:
+            await asyncio.to_thread(_unlink_all, victims)
+
+    async def _write_blob(self, digest: str, data: bytes) -> bool:
+        try:
+            await asyncio.to_thread(_atomic_write_bytes, self._blob_path(digest), data)
+        except OSError as e:
+            print(f"[media_cache] image write failed: {e}")
+            return False
+        self._blobs[digest] = len(data)
+        self._total += len(data)
+        return True
+
+    def _forget_blob(self, digest: str) -> Path:
+        size = self._blobs.pop(digest, None)
+        if size is not None:
+            self._total -= size
+        return self._blob_path(digest)
+
+    def _drop_blob(self, digest: str) -> None:
+        _unlink_all([self._forget_blob(digest)])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._index),
+            "blobs": len(self._blobs),
+            "bytes": self._total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+    def maybe_save(self) -> None:
+        if self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        index = {k: v for k, v in self._index.items() if v.get("hash") in self._blobs}
+        try:
+            _atomic_write_bytes(self._index_path, json.dumps(index).encode("utf-8"))
+            self._dirty = False
+        except Exception as e:
+            print(f"[media_cache] image index save failed: {e}")
+        self._saved_at = time.monotonic()
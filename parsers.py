@@ -1,6 +1,8 @@
 import re
 import unicodedata
-from typing import Dict, Any, Optional, Tuple
+from collections import deque
+from functools import cached_property, lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 
 import json
 from pathlib import Path
@@ -17,6 +19,69 @@ def _norm_simple(s: str) -> str:
     return s.strip()
 
 
+def _norm(s: str) -> str:
+    if not s:
+        return ""
+    s = s.lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = s.replace("’", "'").replace("`", "'").replace("ʼ", "'")
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+
+_FOLD_MAP = str.maketrans({
+    "ё": "е",
+    "ї": "и",
+    "і": "и",
+    "є": "е",
+    "ґ": "г",
+    "ъ": "",
+    "ь": "",
+})
+
+
+def norm_folded(s: str) -> str:
+    s = (s or "").lower().strip()
+    s = s.translate(_FOLD_MAP)
+    s = re.sub(r"[.,;:!?()\[\]\-_/\\]+", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+# One incoming message with its normalizations computed on first use and kept,
+# so every extractor in parsers.py and main.py shares the same work
+class ParsedText:
+    def __init__(self, raw: str):
+        self.raw = raw or ""
+
+    @classmethod
+    def of(cls, text: Any) -> "ParsedText":
+        return text if isinstance(text, ParsedText) else cls(text)
+
+    def __bool__(self) -> bool:
+        return bool(self.raw)
+
+    @cached_property
+    def simple(self) -> str:
+        return _norm_simple(self.raw)
+
+    @cached_property
+    def fuzzy(self) -> str:
+        return _norm(self.raw)
+
+    @cached_property
+    def folded(self) -> str:
+        return norm_folded(self.raw)
+
+    @cached_property
+    def fuzzy_tokens(self) -> List[str]:
+        return self.fuzzy.split()
+
+    @cached_property
+    def fuzzy_segments(self) -> List[Tuple[str, bool]]:
+        return _segments(self.fuzzy)
+
+
 def _load_location_keywords() -> dict:
     try:
         path = Path(__file__).with_name("location_keywords.json")
@@ -32,21 +97,70 @@ def _load_location_keywords() -> dict:
 LOCATION_KEYWORDS = _load_location_keywords()
 
 
-def _detect_location_from_keywords(text: str) -> Optional[str]:
+# Aho-Corasick over LOCATION_KEYWORDS; each node keeps the best key ending on its
+# fail chain (longest, then earliest in the json) so one pass gives the old result
+class _KeywordAutomaton:
+    def __init__(self, keywords: Dict[str, Any]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[Tuple[int, int]]] = [None]
+        self._values: List[Any] = list(keywords.values())
+
+        for idx, key in enumerate(keywords):
+            if not isinstance(key, str) or not key:
+                continue
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = nxt
+            rank = (len(key), -idx)
+            if self._best[node] is None or rank > self._best[node]:
+                self._best[node] = rank
+
+        self._build_links()
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                inherited = self._best[self._fail[nxt]]
+                if inherited is not None and (self._best[nxt] is None or inherited > self._best[nxt]):
+                    self._best[nxt] = inherited
+
+    def longest(self, text: str) -> Optional[Any]:
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        winner = None
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            cand = best[node]
+            if cand is not None and (winner is None or cand > winner):
+                winner = cand
+        return self._values[-winner[1]] if winner is not None else None
+
+
+_LOCATION_AUTOMATON = _KeywordAutomaton(LOCATION_KEYWORDS)
+
+
+def _detect_location_from_keywords(text: Any) -> Optional[str]:
     if not text or not LOCATION_KEYWORDS:
         return None
 
-    t_norm = _norm_simple(text)
-
-    best_match = None
-    best_len = 0
-
-    for norm_key, original in LOCATION_KEYWORDS.items():
-        if norm_key in t_norm and len(norm_key) > best_len:
-            best_match = original
-            best_len = len(norm_key)
-
-    return best_match
+    return _LOCATION_AUTOMATON.longest(ParsedText.of(text).simple)
 
 
 def _match_label_id(text_norm: str, labels: Dict[int, str]) -> Optional[int]:
@@ -67,26 +181,27 @@ def _match_label_id(text_norm: str, labels: Dict[int, str]) -> Optional[int]:
     return best_id
 
 
-def _detect_location(text: str) -> Dict[str, Any]:
+def _detect_location(text: Any) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     if not text:
         return out
 
-    t_norm = _norm_simple(text)
+    pt = ParsedText.of(text)
+    t_norm = pt.simple
 
-    mid = _detect_microarea(text)
+    mid = _detect_microarea(pt)
     if mid is not None:
         out["microarea_id"] = mid
         out["district_text"] = MICROAREA_LABELS.get(mid)
         return out
 
-    did = _detect_district(text)
+    did = _detect_district(pt)
     if did is not None:
         out["district_id"] = did
         out["district_text"] = DISTRICT_LABELS.get(did)
         return out
 
-    loc_from_dict = _detect_location_from_keywords(text)
+    loc_from_dict = _detect_location_from_keywords(pt)
     if loc_from_dict:
         out["district_text"] = loc_from_dict
         return out
@@ -103,16 +218,6 @@ def _detect_location(text: str) -> Dict[str, Any]:
     return out
 
 
-def _norm(s: str) -> str:
-    if not s:
-        return ""
-    s = s.lower()
-    s = unicodedata.normalize("NFKD", s)
-    s = s.replace("’", "'").replace("`", "'").replace("ʼ", "'")
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
-
-
 DISTRICT_LABELS = {
     5: "Київський",
     6: "Малиновський",
@@ -192,54 +297,85 @@ MICROAREAS = {
 }
 
 
-def _lev1(a: str, b: str) -> bool:
-    if a == b:
-        return True
-    if abs(len(a) - len(b)) > 1:
-        return False
-    i = j = diff = 0
-    while i < len(a) and j < len(b):
-        if a[i] == b[j]:
-            i += 1;
-            j += 1
-        else:
-            diff += 1
-            if diff > 1:
-                return False
-            if len(a) > len(b):
-                i += 1
-            elif len(b) > len(a):
-                j += 1
-            else:
-                i += 1;
-                j += 1
-    diff += (len(a) - i) + (len(b) - j)
-    return diff <= 1
-
-
-def _fuzzy_contains(t: str, variant: str) -> bool:
-    t = _norm(t)
-    v = _norm(variant)
-    for w in t.split():
-        if _lev1(w, v):
-            return True
-    return re.search(rf"\b{re.escape(v)}\b", t) is not None
-
-
-def _detect_district(text: str) -> Optional[int]:
-    for did, variants in DISTRICTS.items():
-        for v in variants:
-            if _fuzzy_contains(text, v):
-                return did
-    return None
+_SEGMENT_RE = re.compile(r"(\w+)|\W+")
+
+
+def _segments(t: str) -> List[Tuple[str, bool]]:
+    return [(m.group(0), m.group(1) is not None) for m in _SEGMENT_RE.finditer(t)]
+
+
+def _deletions(w: str):
+    for i in range(len(w)):
+        yield i, w[:i] + w[i + 1:]
+
+
+# Normalized variants of DISTRICTS/MICROAREAS, looked up per message token:
+# Levenshtein-1 via deletion neighbourhoods, and the old `\bvariant\b` check via
+# runs of \w/\W segments (a match always starts and ends on a segment edge).
+# The lowest ordinal wins, which is the old "first variant in dict order" rule.
+class _VariantIndex:
+    def __init__(self, variants_by_id: Dict[int, List[str]]):
+        self._ids: List[int] = []
+        self._exact: Dict[str, int] = {}
+        self._deletes: Dict[str, int] = {}
+        self._subs: Dict[Tuple[str, int], int] = {}
+        self._max_segments = 1
+
+        for vid, variants in variants_by_id.items():
+            for variant in variants:
+                v = _norm(variant)
+                if not v:
+                    continue
+                ordinal = len(self._ids)
+                self._ids.append(vid)
+                self._exact.setdefault(v, ordinal)
+                for i, d in _deletions(v):
+                    self._deletes.setdefault(d, ordinal)
+                    self._subs.setdefault((d, i), ordinal)
+                self._max_segments = max(self._max_segments, len(_segments(v)))
+
+    def _lev1_best(self, w: str) -> Optional[int]:
+        found = [self._exact.get(w), self._deletes.get(w)]
+        for i, d in _deletions(w):
+            found.append(self._exact.get(d))
+            found.append(self._subs.get((d, i)))
+        return min((o for o in found if o is not None), default=None)
+
+    def _bounded_best(self, segs: List[Tuple[str, bool]]) -> Optional[int]:
+        n = len(segs)
+        best = None
+        for i in range(n):
+            if i == 0 and not segs[0][1]:
+                continue
+            phrase = ""
+            for j in range(i, min(n, i + self._max_segments)):
+                phrase += segs[j][0]
+                if j == n - 1 and not segs[j][1]:
+                    break
+                o = self._exact.get(phrase)
+                if o is not None and (best is None or o < best):
+                    best = o
+        return best
 
+    def find(self, pt: "ParsedText") -> Optional[int]:
+        if not pt.fuzzy:
+            return None
+        found = [self._lev1_best(w) for w in pt.fuzzy_tokens]
+        found.append(self._bounded_best(pt.fuzzy_segments))
+        best = min((o for o in found if o is not None), default=None)
+        return self._ids[best] if best is not None else None
 
-def _detect_microarea(text: str) -> Optional[int]:
-    for mid, variants in MICROAREAS.items():
-        for v in variants:
-            if _fuzzy_contains(text, v):
-                return mid
-    return None
+
+_DISTRICT_INDEX = _VariantIndex(DISTRICTS)
+_MICROAREA_INDEX = _VariantIndex(MICROAREAS)
+
+
+def _detect_district(text: Any) -> Optional[int]:
+    return _DISTRICT_INDEX.find(ParsedText.of(text))
+
+
+def _detect_microarea(text: Any) -> Optional[int]:
+    return _MICROAREA_INDEX.find(ParsedText.of(text))
 
 
 ROOMS_NUMBER_MAP = {
@@ -249,61 +385,54 @@ ROOMS_NUMBER_MAP = {
     "чотирикімнат": 4, "чотири кімнати": 4, "четырехкомнат": 4, "4к": 4, "4 к": 4, "4 комнатна": 4, "4 кімнатна": 4,
 }
 
-_ROOMS_RE = re.compile(
-    flags=re.IGNORECASE | re.VERBOSE,
-)
-
-
-def _parse_rooms(text: str) -> Optional[int]:
-    t = _norm_simple(text)
+# Ordered (value, patterns) table compiled into one alternation with a named group
+# per row. The alternation sits in a lookahead, so a single finditer pass sees
+# every (even overlapping) occurrence; the earliest row that occurs anywhere wins,
+# as with the old sequence of `if ... in t` / re.search checks.
+class SlotPatterns:
+    def __init__(self, table: List[Tuple[Any, List[str]]]):
+        self._values = [value for value, _ in table]
+        alts = "|".join(f"(?P<s{i}>{'|'.join(pats)})" for i, (_, pats) in enumerate(table))
+        self.regex = re.compile(f"(?=(?:{alts}))")
+
+    def best(self, t: str) -> Optional[Tuple[Any, str]]:
+        best_i = None
+        best_m = None
+        for m in self.regex.finditer(t):
+            i = int(m.lastgroup[1:])
+            if best_i is None or i < best_i:
+                best_i, best_m = i, m
+                if i == 0:
+                    break
+        if best_m is None:
+            return None
+        return self._values[best_i], best_m.group(best_m.lastgroup)
+
+
+def literal_patterns(*words: str) -> List[str]:
+    return [re.escape(w) for w in words]
+
+
+_ROOMS_RE = SlotPatterns([
+    (1, literal_patterns("однуш", "однокiмн", "однокімнат", "однокомнат")),
+    (2, literal_patterns("двуш", "двокiмн", "двокімнат", "двухкомнат")),
+    (3, literal_patterns("трешк", "трішк", "тришк", "трикімнат", "трехкомнат")),
+    (4, literal_patterns("четырехкомнат", "чотирикiмн", "чотирикімнат")),
+    (None, [r"\b[1-4]\s*(?:кімн|комн)"]),
+    (None, [r"\b[1-4]\s*к\b"]),
+])
+
+
+def _parse_rooms(text: Any) -> Optional[int]:
+    t = ParsedText.of(text).simple
     if not t:
         return None
 
-    ROOM_PATTERNS = {
-        1: [
-            r"однуш\w*",
-            r"однокiмн\w*",
-            r"однокімнат\w*",
-            r"однокомнат\w*",
-        ],
-        2: [
-            r"двуш\w*",
-            r"двокiмн\w*",
-            r"двокімнат\w*",
-            r"двухкомнат\w*",
-        ],
-        3: [
-            r"трешк\w*",
-            r"трішк\w*",
-            r"тришк\w*",
-            r"трикімнат\w*",
-            r"трехкомнат\w*",
-        ],
-        4: [
-            r"четырехкомнат\w*",
-            r"чотирикiмн\w*",
-            r"чотирикімнат\w*",
-        ],
-    }
-
-    for rooms, patterns in ROOM_PATTERNS.items():
-        for pat in patterns:
-            if re.search(pat, t):
-                return rooms
-
-    m = re.search(
-        r"\b([1-4])\s*(кімнат\w*|кімн\w*|комнат\w*|комн\w*)",
-        t,
-    )
-    if m:
-        return int(m.group(1))
-
-    m2 = re.search(r"\b([1-4])\s*к\b", t)
-    if m2:
-        return int(m2.group(1))
-
-    return None
-
+    hit = _ROOMS_RE.best(t)
+    if hit is None:
+        return None
+    rooms, matched = hit
+    return rooms if rooms is not None else int(matched[0])
 
 
 _BUDGET_RE = re.compile(
@@ -316,9 +445,11 @@ _BUDGET_RE = re.compile(
     flags=re.IGNORECASE | re.VERBOSE,
 )
 
+_BUDGET_SHORT_RE = re.compile(r"[1-9][kк]")
 
-def _parse_budget_value(text: str) -> Optional[int]:
-    t = _norm_simple(text)
+
+def _parse_budget_value(text: Any) -> Optional[int]:
+    t = ParsedText.of(text).simple
     if not t:
         return None
 
@@ -335,7 +466,7 @@ def _parse_budget_value(text: str) -> Optional[int]:
             .replace(" ", "")
         )
 
-        if not cur and re.fullmatch(r"[1-9][kк]", cleaned):
+        if not cur and _BUDGET_SHORT_RE.fullmatch(cleaned):
             continue
 
         if cleaned.endswith(("k", "к")):
@@ -356,47 +487,33 @@ def _parse_budget_value(text: str) -> Optional[int]:
     return max(candidates)
 
 
-def _parse_condition(text: str) -> Optional[int]:
-    t = _norm_simple(text)
+_CONDITION_RE = SlotPatterns([
+    (8, literal_patterns("евроремонт", "євроремонт", "готовим ремонтом") + [r"(?:з|с)\s+ремонт"]),
+    (18, literal_patterns("під ремонт", "под ремонт", "требує ремонт", "требует ремонт")),
+    (9, literal_patterns(
+        "без ремонт",
+        "от строител", "после строител",
+        "от застройщик", "застройщика",
+        "вид будивельник", "вид будівельник", "від будівельник",
+        "від забудовник", "вид забудовник",
+        "пiсля будiвельник", "після будівельник",
+        "в новобудов", "в новостройк",
+    )),
+    (6, literal_patterns("під оздоб", "под отделоч")),
+    (14, literal_patterns("капитальн", "капітальн", "хороший ремонт")),
+])
+
+
+def _parse_condition(text: Any) -> Optional[int]:
+    t = ParsedText.of(text).simple
     if not t:
         return None
 
-    if (
-        "евроремонт" in t
-        or "євроремонт" in t
-        or "готовим ремонтом" in t
-        or re.search(r"(з|с)\s+ремонт", t)
-    ):
-        return 8
-
-    if "під ремонт" in t or "под ремонт" in t or "требує ремонт" in t or "требует ремонт" in t:
-        return 18
-
-    if (
-        "без ремонт" in t
-        or "от строител" in t
-        or "после строител" in t
-        or "от застройщик" in t or "застройщика" in t
-        or "вид будивельник" in t or "вид будівельник" in t
-        or "від будівельник" in t
-        or "від забудовник" in t or "вид забудовник" in t
-        or "пiсля будiвельник" in t
-        or "після будівельник" in t
-        or "в новобудов" in t
-        or "в новостройк" in t
-    ):
-        return 9
-
-    if "під оздоб" in t or "под отделоч" in t:
-        return 6
-
-    if "капитальн" in t or "капітальн" in t or "хороший ремонт" in t:
-        return 14
+    hit = _CONDITION_RE.best(t)
+    return hit[0] if hit else None
 
-    return None
 
-
-def interpret_answer_for_key(key: str, text: str):
+def interpret_answer_for_key(key: str, text: Any):
     if key == "rooms_in":
         return _parse_rooms(text)
     if key in ("budget", "price_max"):
@@ -408,7 +525,7 @@ def interpret_answer_for_key(key: str, text: str):
     if key == "microarea_id":
         return _detect_microarea(text)
     if key == "type":
-        t = _norm(text)
+        t = ParsedText.of(text).fuzzy
         if "квартир" in t:
             return "квартира"
         if "будин" in t or "котедж" in t:
@@ -417,31 +534,51 @@ def interpret_answer_for_key(key: str, text: str):
     return None
 
 
-def parse_free_text(text: str) -> Dict[str, Any]:
-    result: Dict[str, Any] = {}
+PARSE_CACHE_SIZE = 4096
+
+
+def parse_free_text(text: Any) -> Dict[str, Any]:
     if not text:
+        return {}
+    return dict(_parse_free_text_cached(ParsedText.of(text).raw))
+
+
+def parse_cache_info():
+    return _parse_free_text_cached.cache_info()
+
+
+# Keyed on the raw text: the normalized forms aren't derivable from one another
+# (NFKD can yield uppercase, as in "ℌ" or "Ⅳ"); entries are item tuples, copied out
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_free_text_cached(raw: str) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(_parse_free_text(ParsedText(raw)).items())
+
+
+def _parse_free_text(pt: ParsedText) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    if not pt:
         return result
 
-    t_norm = _norm_simple(text)
+    t_norm = pt.simple
 
     if "квартир" in t_norm or "kvartir" in t_norm:
         result["type"] = "apartment"
     elif "будинок" in t_norm or "будин" in t_norm or "дом" in t_norm or "house" in t_norm:
         result["type"] = "house"
 
-    rooms = _parse_rooms(text)
+    rooms = _parse_rooms(pt)
     if rooms is not None:
         result["rooms_in"] = rooms
 
-    budget = _parse_budget_value(text)
+    budget = _parse_budget_value(pt)
     if budget is not None:
         result["price_max"] = budget
 
-    cond = _parse_condition(text)
+    cond = _parse_condition(pt)
     if cond is not None:
         result["condition_in"] = cond
 
-    loc = _detect_location(text)
+    loc = _detect_location(pt)
     result.update(loc)
 
     return result
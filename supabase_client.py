@@ -2,7 +2,11 @@ from __future__ import annotations
 import asyncio
 import uuid
 import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
 try:
     from supabase import create_client, Client as SupabaseClientSDK  # type: ignore
@@ -11,18 +15,66 @@ except Exception:
     SupabaseClientSDK = object  # stub
 
 from config import cfg
+from fallback_store import FallbackStore
+
+
+class _SessionScope:
+    __slots__ = ("user_id", "session_id", "pending", "closed")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.session_id: Any = None
+        self.pending: Dict[str, Any] = {}
+        self.closed = False
+
+
+_session_scope: ContextVar[Optional[_SessionScope]] = ContextVar("session_scope", default=None)
 
 
 class SupabaseClient:
 
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
         self.url: str = cfg.supabase_url
         self.key: str = getattr(cfg, "supabase_key", "") or getattr(cfg, "supabase_anon_key", "")
         self.enabled: bool = bool(self.url and self.key and create_client is not None)
 
-        self._mem_users: Dict[int, Dict[str, Any]] = {}
-        self._mem_sessions: Dict[int, Dict[str, Any]] = {}
-        self._mem_messages: Dict[str, list] = {}
+        # the sdk is blocking; its calls run on a small pool, and callers past
+        # max_pending wait on the loop instead of piling up in the pool's queue
+        self.workers = max(0, cfg.supabase_workers if workers is None else workers)
+        self.max_pending = max(1, cfg.supabase_max_pending if max_pending is None else max_pending)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self.counts: Dict[str, int] = {"calls": 0, "running": 0, "waiting": 0, "peak_waiting": 0}
+        self.wait_seconds = 0.0
+
+        # message log is written behind the reply, in batches
+        self._outbox: "deque[Dict[str, Any]]" = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Future] = None
+        self._writer_idle = False
+        self._in_flight: List[Dict[str, Any]] = []
+        self._closing = False
+        self.message_counts: Dict[str, int] = {
+            "queued": 0, "written": 0, "batches": 0, "retries": 0, "dropped": 0, "failed": 0,
+        }
+
+        # telegram user id -> (loaded_at, session row); rows are updated in place
+        self._sessions: "OrderedDict[int, tuple]" = OrderedDict()
+        self._session_users: Dict[Any, int] = {}
+        self._user_locks: Dict[int, list] = {}
+        self.session_counts: Dict[str, int] = {"hit": 0, "miss": 0, "coalesced": 0, "writes": 0, "failed": 0}
+
+        # telegram user id -> users.id; only an upsert can change it
+        self._user_ids: "OrderedDict[int, Any]" = OrderedDict()
+        self.user_counts: Dict[str, int] = {"hit": 0, "miss": 0}
+
+        self._mem = FallbackStore(
+            max_users=cfg.fallback_max_users,
+            max_sessions=cfg.fallback_max_sessions,
+            messages_per_session=cfg.fallback_messages_per_session,
+            ttl=cfg.fallback_ttl,
+            sqlite_path=cfg.fallback_sqlite_path,
+        )
 
         if self.enabled:
             try:
@@ -30,6 +82,133 @@ class SupabaseClient:
             except Exception:
                 self.enabled = False
 
+    async def _run(self, call: Callable[[], Any]) -> Any:
+        self.counts["calls"] += 1
+        if self.workers == 0:
+            return call()
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="supabase")
+
+        self.counts["waiting"] += 1
+        self.counts["peak_waiting"] = max(self.counts["peak_waiting"], self.counts["waiting"])
+        started = time.monotonic()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.counts["waiting"] -= 1
+        self.wait_seconds += time.monotonic() - started
+
+        self.counts["running"] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            self.counts["running"] -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "max_pending": self.max_pending,
+                "wait_seconds": round(self.wait_seconds, 3), **self.counts,
+                "messages": {"pending": len(self._outbox), **self.message_counts},
+                "sessions": {"cached": len(self._sessions), **self.session_counts},
+                "users": {"cached": len(self._user_ids), **self.user_counts},
+                "fallback": self._mem.stats()}
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._writer is not None and not self._writer.done():
+            self._wake.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._writer), cfg.message_drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"[SUPABASE] drain timed out, {len(self._in_flight) + len(self._outbox)} messages kept in memory only")
+                self._writer.cancel()
+                # the batch being inserted was already taken off the outbox
+                for row in self._in_flight:
+                    self._remember_message(row)
+                self._in_flight = []
+                while self._outbox:
+                    self._remember_message(self._outbox.popleft())
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown)
+            self._pool = None
+        await self._mem.close()
+
+    def _cached_session(self, telegram_user_id: Any) -> Optional[Dict[str, Any]]:
+        entry = self._sessions.get(telegram_user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > cfg.session_cache_ttl:
+            self._drop_session(telegram_user_id)
+            return None
+        self._sessions.move_to_end(telegram_user_id)
+        return entry[1]
+
+    def _cache_session(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        tuid = row.get("telegram_user_id")
+        if tuid is None:
+            return row
+        entry = self._sessions.get(tuid)
+        if entry is not None and entry[1] is not row:
+            # keep the dict handlers already hold in sync
+            entry[1].update(row)
+            row = entry[1]
+        self._sessions[tuid] = (time.monotonic(), row)
+        self._sessions.move_to_end(tuid)
+        self._session_users[row.get("id")] = tuid
+        while len(self._sessions) > max(1, cfg.session_cache_size):
+            self._drop_session(next(iter(self._sessions)))
+        return row
+
+    def _drop_session(self, telegram_user_id: Any) -> None:
+        entry = self._sessions.pop(telegram_user_id, None)
+        if entry is not None:
+            self._session_users.pop(entry[1].get("id"), None)
+
+    @asynccontextmanager
+    async def session_scope(self, telegram_user_id: int) -> AsyncIterator[None]:
+        # one handler invocation: updates for the same user run one at a time,
+        # and their session patches go out as a single update at the end
+        current = _session_scope.get()
+        if not self.enabled or (current is not None and not current.closed):
+            yield
+            return
+
+        entry = self._user_locks.setdefault(telegram_user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                scope = _SessionScope(telegram_user_id)
+                token = _session_scope.set(scope)
+                try:
+                    yield
+                finally:
+                    _session_scope.reset(token)
+                    scope.closed = True
+                    if scope.pending:
+                        await self._write_session_patch(scope.session_id, scope.pending)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_locks.pop(telegram_user_id, None)
+
+    def _remember_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        tuid = user.get("telegram_user_id")
+        if tuid is not None and user.get("id") is not None:
+            self._user_ids[tuid] = user["id"]
+            self._user_ids.move_to_end(tuid)
+            while len(self._user_ids) > max(1, cfg.user_cache_size):
+                self._user_ids.popitem(last=False)
+        return user
+
+    async def get_user_id(self, telegram_user_id: int) -> Any:
+        uid = self._user_ids.get(telegram_user_id)
+        if uid is not None:
+            self._user_ids.move_to_end(telegram_user_id)
+            self.user_counts["hit"] += 1
+            return uid
+        self.user_counts["miss"] += 1
+        return (await self.get_or_create_user_obj(telegram_user_id))["id"]
+
     def _mem_user_id(self, telegram_user_id: int) -> str:
         return f"user_{telegram_user_id}"
 
@@ -47,30 +226,36 @@ class SupabaseClient:
                     "username": tg_user.username,
                     "first_name": tg_user.first_name,
                 }
-                res = self.client.table("users").upsert(data, on_conflict="telegram_user_id").execute()
+                self._user_ids.pop(tg_user.id, None)
+                res = await self._run(
+                    lambda: self.client.table("users").upsert(data, on_conflict="telegram_user_id").execute()
+                )
                 if res.data:
-                    return res.data[0]
+                    return self._remember_user(res.data[0])
             except Exception:
                 pass
-        u = self._mem_users.get(tg_user.id) or {
+        u = await self._mem.get_user(tg_user.id) or {
             "id": str(uuid.uuid4()),
             "telegram_user_id": tg_user.id,
             "username": tg_user.username,
             "first_name": tg_user.first_name,
             "created_at": int(time.time()),
         }
-        self._mem_users[tg_user.id] = u
-        return u
+        self._mem.put_user(tg_user.id, u)
+        # a stand-in user from a failed call shouldn't stick once the database is back
+        return u if self.enabled else self._remember_user(u)
 
     async def get_or_create_user_obj(self, telegram_user_id: int) -> Dict[str, Any]:
         if self.enabled:
             try:
-                res = self.client.table("users").select("*").eq("telegram_user_id", telegram_user_id).limit(1).execute()
+                res = await self._run(
+                    lambda: self.client.table("users").select("*").eq("telegram_user_id", telegram_user_id).limit(1).execute()
+                )
                 if res.data:
-                    return res.data[0]
+                    return self._remember_user(res.data[0])
             except Exception:
                 pass
-        u = self._mem_users.get(telegram_user_id)
+        u = await self._mem.get_user(telegram_user_id)
         if not u:
             u = {
                 "id": str(uuid.uuid4()),
@@ -79,17 +264,23 @@ class SupabaseClient:
                 "first_name": None,
                 "created_at": int(time.time()),
             }
-            self._mem_users[telegram_user_id] = u
-        return u
+            self._mem.put_user(telegram_user_id, u)
+        return u if self.enabled else self._remember_user(u)
 
     async def get_or_create_session(self, telegram_user_id: int) -> Dict[str, Any]:
         if self.enabled:
+            cached = self._cached_session(telegram_user_id)
+            if cached is not None:
+                self.session_counts["hit"] += 1
+                return cached
+            self.session_counts["miss"] += 1
             try:
-                res = self.client.table("sessions").select("*").eq("telegram_user_id", telegram_user_id).eq("status",
-                                                                                                            "active").limit(
-                    1).execute()
+                res = await self._run(
+                    lambda: self.client.table("sessions").select("*").eq("telegram_user_id", telegram_user_id)
+                    .eq("status", "active").limit(1).execute()
+                )
                 if res.data:
-                    return res.data[0]
+                    return self._cache_session(res.data[0])
                 data = {
                     "telegram_user_id": telegram_user_id,
                     "status": "active",
@@ -101,13 +292,13 @@ class SupabaseClient:
                     "page_offset": 0,
                     "total": 0,
                 }
-                res = self.client.table("sessions").insert(data).execute()
-                return res.data[0]
+                res = await self._run(lambda: self.client.table("sessions").insert(data).execute())
+                return self._cache_session(res.data[0])
             except Exception:
                 pass
 
         sid = self._mem_session_id(telegram_user_id)
-        s = self._mem_sessions.get(telegram_user_id)
+        s = await self._mem.get_session(telegram_user_id)
         if not s:
             s = {
                 "id": sid,
@@ -121,52 +312,136 @@ class SupabaseClient:
                 "page_offset": 0,
                 "total": 0,
             }
-            self._mem_sessions[telegram_user_id] = s
+            self._mem.put_session(s)
         return s
 
     async def patch_session(self, session_id_or_obj: Any, patch: Dict[str, Any]) -> Dict[str, Any]:
         if self.enabled:
+            sid = session_id_or_obj.get("id") if isinstance(session_id_or_obj, dict) else session_id_or_obj
+            tuid = self._session_users.get(sid)
+            cached = self._cached_session(tuid) if tuid is not None else None
+            if cached is not None:
+                cached.update(patch)
+                scope = _session_scope.get()
+                if scope is not None and not scope.closed and scope.user_id == tuid:
+                    scope.session_id = sid
+                    scope.pending.update(patch)
+                    self.session_counts["coalesced"] += 1
+                    return cached
+        return await self._write_session_patch(session_id_or_obj, patch)
+
+    async def _write_session_patch(self, session_id_or_obj: Any, patch: Dict[str, Any]) -> Dict[str, Any]:
+        if self.enabled:
+            sid = session_id_or_obj.get("id") if isinstance(session_id_or_obj, dict) else session_id_or_obj
+            error: Any = "no row updated"
             try:
-                if isinstance(session_id_or_obj, dict):
-                    sid = session_id_or_obj.get("id")
-                else:
-                    sid = session_id_or_obj
-                res = self.client.table("sessions").update(patch).eq("id", sid).execute()
+                self.session_counts["writes"] += 1
+                res = await self._run(lambda: self.client.table("sessions").update(patch).eq("id", sid).execute())
                 if res.data:
-                    return res.data[0]
-            except Exception:
-                pass
+                    return self._cache_session(res.data[0])
+            except Exception as e:
+                error = e
+            # the cached row already carries the patch; drop it so the next read
+            # reloads what the database actually has
+            print(f"[SUPABASE] session {sid} patch failed: {error}")
+            self.session_counts["failed"] += 1
+            tuid = self._session_users.get(sid)
+            cached = self._cached_session(tuid) if tuid is not None else None
+            if cached is not None:
+                self._drop_session(tuid)
+                return cached
 
+        s = None
         if isinstance(session_id_or_obj, dict):
             tuid = session_id_or_obj.get("telegram_user_id")
-            if tuid and tuid in self._mem_sessions:
-                self._mem_sessions[tuid].update(patch)
-                return self._mem_sessions[tuid]
-        for tuid, s in self._mem_sessions.items():
-            if s.get("id") == session_id_or_obj:
-                s.update(patch)
-                return s
+            if tuid:
+                s = await self._mem.get_session(tuid)
+            sid = session_id_or_obj.get("id")
+        else:
+            sid = session_id_or_obj
+        if s is None:
+            s = await self._mem.session_by_id(sid)
+        if s is not None:
+            s.update(patch)
+            self._mem.put_session(s)
+            return s
         return session_id_or_obj if isinstance(session_id_or_obj, dict) else {"id": session_id_or_obj, **patch}
 
     async def append_message(self, session_id: Any, user_uuid: Any, direction: str, text: str) -> None:
-        if self.enabled:
-            try:
-                data = {
-                    "session_id": session_id,
-                    "user_uuid": user_uuid,
-                    "direction": direction,
-                    "text": text,
-                    "ts": int(time.time()),
-                }
-                self.client.table("messages").insert(data).execute()
-                return
-            except Exception:
-                pass
-
-        sid = str(session_id)
-        self._mem_messages.setdefault(sid, []).append({
+        row = {
+            "session_id": session_id,
             "user_uuid": user_uuid,
             "direction": direction,
             "text": text,
             "ts": int(time.time()),
+        }
+        if not self.enabled or self._closing:
+            self._remember_message(row)
+            return
+
+        if len(self._outbox) >= cfg.message_queue_size:
+            self._outbox.popleft()
+            self.message_counts["dropped"] += 1
+        self._outbox.append(row)
+        self.message_counts["queued"] += 1
+
+        if self._writer is None or self._writer.done():
+            self._wake = asyncio.Event()
+            self._writer = asyncio.ensure_future(self._write_messages())
+        # an idle writer starts its flush interval on the first row; a busy one
+        # only needs waking for a full batch
+        if self._writer_idle or len(self._outbox) >= cfg.message_batch_size:
+            self._wake.set()
+
+    async def _write_messages(self) -> None:
+        size = max(1, cfg.message_batch_size)
+        while True:
+            if not self._outbox:
+                if self._closing:
+                    return
+                self._writer_idle = True
+                try:
+                    await self._wake.wait()
+                finally:
+                    self._writer_idle = False
+                self._wake.clear()
+                continue
+            if len(self._outbox) < size and not self._closing:
+                # give the batch a moment to fill up
+                try:
+                    await asyncio.wait_for(self._wake.wait(), cfg.message_flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            self._in_flight = [self._outbox.popleft() for _ in range(min(size, len(self._outbox)))]
+            await self._flush_messages(self._in_flight)
+            self._in_flight = []
+
+    async def _flush_messages(self, rows: List[Dict[str, Any]]) -> None:
+        delay = 0.5
+        error: Optional[Exception] = None
+        for attempt in range(max(0, cfg.message_flush_retries) + 1):
+            if attempt:
+                self.message_counts["retries"] += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+            try:
+                await self._run(lambda: self.client.table("messages").insert(rows).execute())
+            except Exception as e:
+                error = e
+                continue
+            self.message_counts["written"] += len(rows)
+            self.message_counts["batches"] += 1
+            return
+        print(f"[SUPABASE] messages insert failed, keeping {len(rows)} in memory: {error}")
+        self.message_counts["failed"] += len(rows)
+        for row in rows:
+            self._remember_message(row)
+
+    def _remember_message(self, row: Dict[str, Any]) -> None:
+        self._mem.add_message(row["session_id"], {
+            "user_uuid": row["user_uuid"],
+            "direction": row["direction"],
+            "text": row["text"],
+            "ts": row["ts"],
         })